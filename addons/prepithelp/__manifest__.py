@@ -19,8 +19,14 @@
     'depends': ['base', 'point_of_sale', 'stock'],
 
     'data': [
-        # 'security/ir.model.access.csv',
+        'security/ir.model.access.csv',
+        'data/ir_cron.xml',
+        'data/prepit_menu_data.xml',
         'views/views.xml',
+        'views/prepit_outbox_views.xml',
+        'views/pos_config_views.xml',
+        'views/prepit_sync_run_views.xml',
+        'views/prepit_sync_job_views.xml',
     ],
     'installable': True,
     'application': False,
@@ -0,0 +1,18 @@
+"""Offline performance benchmarks for the Prepit integration.
+
+Not imported by the addon itself. Run them from an Odoo shell on a
+throw-away database with prepithelp (and my_api_integration) installed::
+
+    odoo-bin shell -d prepit_bench --no-http <<'EOF'
+    from odoo.addons.prepithelp.benchmarks import runner
+    runner.run(env, scale='large', output='/tmp/prepit-bench.json')
+    EOF
+
+Pass ``enforce_budgets=True`` to fail when a scenario exceeds its query
+budget (``runner.QUERY_BUDGETS``).
+
+Every scenario talks to a local stand-in for api-pos.dev.prepit.app and all
+seeded data is rolled back at the end. Compare two result files with::
+
+    python addons/prepithelp/benchmarks/compare.py old.json new.json
+"""
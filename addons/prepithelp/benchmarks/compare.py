@@ -0,0 +1,51 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage: python compare.py BASELINE.json CANDIDATE.json [--threshold 0.2]
+Exits with status 1 when any metric grew by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('wall_s', 'queries', 'peak_memory_bytes', 'http_requests')
+
+
+def compare(baseline, candidate, threshold=0.2):
+    """Return (scenario, metric, old, new) tuples for every regression"""
+    old_by_name = {result['scenario']: result for result in baseline['results']}
+    regressions = []
+    for result in candidate['results']:
+        old = old_by_name.get(result['scenario'])
+        if not old:
+            continue
+        for metric in METRICS:
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + threshold) and after - before > 0:
+                regressions.append((result['scenario'], metric, before, after))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = compare(baseline, candidate, args.threshold)
+    for scenario, metric, before, after in regressions:
+        print(f"REGRESSION {scenario} {metric}: {before} -> {after}")
+    if not regressions:
+        print("No regressions above %d%%" % (args.threshold * 100))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
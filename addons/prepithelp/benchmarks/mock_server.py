@@ -0,0 +1,112 @@
+"""Local stand-in for the Prepit gateway with configurable latency and errors."""
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockPrepitServer:
+    """Threaded HTTP server answering every Prepit route with a canned JSON reply.
+
+    ``partners`` synthetic records are served, paginated, on ``/your_endpoint``
+    for the ApiSyncHandler import.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, partners=0, seed=42):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.partners = partners
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.errors = self.bytes_received = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'http_requests': self.requests,
+                'http_errors': self.errors,
+                'http_bytes_received': self.bytes_received,
+            }
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _partner_page(self, query):
+        page = int(query.get('page', ['1'])[0])
+        limit = int(query.get('limit', [str(self.partners)])[0])
+        start = (page - 1) * limit
+        return [{
+            'id': index,
+            'full_name': f"Bench Partner {index}",
+            'email': f"partner{index}@bench.example",
+            'phone_no': f"+20100{index:07d}",
+        } for index in range(start, min(start + limit, self.partners))]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                with server._lock:
+                    server.requests += 1
+                    server.bytes_received += length
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if server._should_fail():
+                    with server._lock:
+                        server.errors += 1
+                    status, reply = 503, {'error': 'injected failure'}
+                else:
+                    url = urlparse(self.path)
+                    if url.path.rstrip('/') == '/your_endpoint':
+                        status, reply = 200, server._partner_page(parse_qs(url.query))
+                    else:
+                        status, reply = 200, {'ok': True}
+
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = do_PUT = _handle
+
+        return Handler
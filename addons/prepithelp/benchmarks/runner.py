@@ -0,0 +1,174 @@
+"""Benchmark scenarios for the Prepit integration, run against a mock gateway."""
+import json
+import logging
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from odoo import release
+from odoo.http import _request_stack
+from odoo.addons.prepithelp.tools.profiling import QueryBudgetExceeded
+
+from .mock_server import MockPrepitServer
+from .seed import SCALES, seed
+
+_logger = logging.getLogger(__name__)
+
+WEBHOOK_ORDERS = 200
+INBOUND_ORDERS = 50
+
+# scenario -> (fixed queries, queries per record); batched code must stay within
+# these whatever the dataset size, so an N+1 shows up as an over-budget scenario
+QUERY_BUDGETS = {
+    'prepare_categories_payload': (20, 0),
+    'prepare_branches_payload': (20, 0),
+    # Telemetry is written through its own cursor and not counted here
+    'post_prepit_webhook_with_stock': (30, 0),
+}
+
+
+class _BenchRequest:
+    """Just enough of odoo.http.request for controllers that only use request.env"""
+
+    def __init__(self, env):
+        self.env = env
+
+
+@contextmanager
+def _as_request(env):
+    _request_stack.push(_BenchRequest(env))
+    try:
+        yield
+    finally:
+        _request_stack.pop()
+
+
+class Bench:
+    """Collects one result dict per measured scenario"""
+
+    def __init__(self, env, server, trace_memory=True):
+        self.env = env
+        self.server = server
+        self.trace_memory = trace_memory
+        self.results = []
+
+    @contextmanager
+    def measure(self, scenario, records=0, **meta):
+        env = self.env
+        # Start every scenario from a cold cache with nothing pending
+        env.flush_all()
+        env.invalidate_all()
+        self.server.reset_stats()
+        result = {'scenario': scenario, **meta}
+        queries = env.cr.sql_log_count
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield result
+            env.flush_all()
+        except Exception as e:
+            # A failing scenario is reported, the remaining ones still run
+            _logger.exception("Benchmark %s failed", scenario)
+            result['error'] = str(e)
+        finally:
+            result['wall_s'] = round(time.perf_counter() - started, 4)
+            result['queries'] = env.cr.sql_log_count - queries
+            if scenario in QUERY_BUDGETS:
+                fixed, per_record = QUERY_BUDGETS[scenario]
+                result['query_budget'] = fixed + per_record * records
+                result['over_budget'] = result['queries'] > result['query_budget']
+            if self.trace_memory:
+                result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            result.update(self.server.stats())
+            self.results.append(result)
+            _logger.info("Benchmark %s: %s", scenario, result)
+
+
+def run(env, scale='small', latency=0.02, error_rate=0.0, output=None, trace_memory=True,
+        enforce_budgets=False):
+    """Seed a synthetic dataset, run every scenario and return the results.
+
+    ``scale`` is a key of ``seed.SCALES`` or a dict with the same keys. The
+    current transaction is rolled back afterwards, seeded data included;
+    results are written as JSON to ``output``. With ``enforce_budgets``,
+    scenarios over their query budget raise ``QueryBudgetExceeded`` once the
+    report is written, so CI fails on N+1 regressions.
+    """
+    sizes = dict(SCALES[scale]) if isinstance(scale, str) else dict(scale)
+    env = env(su=True)
+    cr = env.cr
+    with MockPrepitServer(latency=latency, error_rate=error_rate, partners=sizes['partners']) as server:
+        try:
+            env['ir.config_parameter'].set_param('api_integration.url', server.url)
+            env['ir.config_parameter'].set_param('api_integration.token', 'bench-token')
+            data = seed(env, **sizes)
+            bench = Bench(env, server, trace_memory=trace_memory)
+            _run_scenarios(bench, data, sizes)
+        finally:
+            cr.rollback()
+            # The mock URL and token were cached in the settings snapshot
+            env.registry.clear_cache()
+
+    report = {
+        'odoo_version': release.version,
+        'python_version': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sizes': sizes,
+        'latency': latency,
+        'error_rate': error_rate,
+        'results': bench.results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    over = [result for result in bench.results if result.get('over_budget')]
+    if enforce_budgets and over:
+        raise QueryBudgetExceeded(', '.join(
+            f"{result['scenario']} ran {result['queries']} queries (budget {result['query_budget']})"
+            for result in over
+        ))
+    return report
+
+
+def _run_scenarios(bench, data, sizes):
+    env = bench.env
+    helper = env['prepithelp.prepithelp']
+
+    with bench.measure('prepare_categories_payload', records=sizes['categories'], categories=sizes['categories']):
+        helper._prepare_categories_payload()
+
+    with bench.measure('prepare_branches_payload', records=sizes['branches'], branches=sizes['branches']):
+        helper._prepare_branches_payload()
+
+    orders = data['orders'][:WEBHOOK_ORDERS]
+    with bench.measure('post_prepit_webhook_with_stock', records=len(orders), orders=len(orders)):
+        orders._post_prepit_webhook_with_stock()
+
+    if 'api.sync.handler' in env:
+        with bench.measure('api_sync_partner_import', partners=sizes['partners']):
+            env['api.sync.handler'].action_sync_data()
+
+    _bench_inbound_orders(bench, data)
+
+
+def _bench_inbound_orders(bench, data):
+    from odoo.addons.prepithelp.controllers.controllers import PrepitPOSController
+
+    products = data['products'][:10]
+    # The seeded branch has an open session; without a branch orders go to config 1,
+    # whose session would be opened and committed outside the benchmark transaction
+    payloads = [{
+        'branch_id': data['config'].prepit_branch_id,
+        'order_ref': f"BENCH-{index}",
+        'amount_total': 10.0 * len(products),
+        'lines': [{'product_id': product.id, 'qty': 1, 'price_unit': 10.0} for product in products],
+    } for index in range(INBOUND_ORDERS)]
+
+    controller = PrepitPOSController()
+    with _as_request(bench.env):
+        with bench.measure('prepit_order_controller', orders=len(payloads)) as result:
+            statuses = [controller.prepit_order(**payload)['status'] for payload in payloads]
+            result['failed_orders'] = statuses.count('error')
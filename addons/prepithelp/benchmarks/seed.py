@@ -0,0 +1,83 @@
+"""Synthetic catalog, branch and order generator for the benchmarks."""
+import logging
+
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+SCALES = {
+    'small': {
+        'products': 500, 'categories': 25, 'branches': 10,
+        'orders': 200, 'lines_per_order': 5, 'partners': 1000,
+    },
+    'large': {
+        'products': 10000, 'categories': 500, 'branches': 300,
+        'orders': 10000, 'lines_per_order': 10, 'partners': 50000,
+    },
+}
+
+BATCH = 1000
+
+
+def seed(env, products, categories, branches, orders, lines_per_order, **_unused):
+    """Create the synthetic dataset and return the records the scenarios need"""
+    categ = env['pos.category'].create([
+        {'name': f"Bench Category {index}", 'sequence': index}
+        for index in range(categories)
+    ])
+    _logger.info("Seeded %d POS categories", len(categ))
+
+    product_ids = []
+    for indexes in split_every(BATCH, range(products)):
+        product_ids += env['product.product'].create([{
+            'name': f"Bench Product {index}",
+            'list_price': 10.0 + index % 90,
+            'available_in_pos': True,
+            'pos_categ_ids': [(6, 0, [categ[index % len(categ)].id])],
+        } for index in indexes]).ids
+        env.invalidate_all()
+    products = env['product.product'].browse(product_ids)
+    _logger.info("Seeded %d POS products", len(products))
+
+    configs = env['pos.config'].create([
+        {'name': f"Bench Branch {index}"} for index in range(branches)
+    ])
+    _logger.info("Seeded %d POS branches", len(configs))
+
+    configs[0].open_session_cb()
+    session = configs[0].current_session_id
+    order_ids = []
+    for indexes in split_every(BATCH // max(1, lines_per_order), range(orders)):
+        vals_list = []
+        for index in indexes:
+            lines = []
+            for line_index in range(lines_per_order):
+                product_id = product_ids[(index * lines_per_order + line_index) % len(product_ids)]
+                lines.append((0, 0, {
+                    'product_id': product_id,
+                    'qty': 1,
+                    'price_unit': 10.0,
+                    'price_subtotal': 10.0,
+                    'price_subtotal_incl': 10.0,
+                }))
+            total = 10.0 * lines_per_order
+            vals_list.append({
+                'session_id': session.id,
+                'amount_tax': 0.0,
+                'amount_total': total,
+                'amount_paid': total,
+                'amount_return': 0.0,
+                'lines': lines,
+            })
+        order_ids += env['pos.order'].create(vals_list).ids
+        env.invalidate_all()
+    _logger.info("Seeded %d POS orders with %d lines each", len(order_ids), lines_per_order)
+
+    return {
+        'categories': categ,
+        'products': products,
+        'configs': configs,
+        'config': configs[0],
+        'session': session,
+        'orders': env['pos.order'].browse(order_ids),
+    }
@@ -1,13 +1,34 @@
-from odoo import http
+from odoo import http, fields
+from odoo.exceptions import ConcurrencyError
 from odoo.http import request
+from psycopg2 import IntegrityError, errors
 import logging
 
+from ..tools.profiling import profiled
+
 _logger = logging.getLogger(__name__)
 
+# Errors Odoo answers by replaying the whole request with a fresh transaction
+# after a short, growing random delay; they must never be turned into a result
+RETRYABLE_ERRORS = (
+    errors.SerializationFailure, errors.DeadlockDetected, errors.LockNotAvailable, ConcurrencyError,
+)
+
+# First key of the advisory locks serialising session opening per config
+SESSION_OPEN_LOCK = 0x5052_4550  # "PREP"
+
+def _is_record_id(value):
+    """Whether a payload value can be a record id"""
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
 class PrepitPOSController(http.Controller):
 
+    # (database, config id) -> id of the last open session seen for that config
+    _session_cache = {}
+
     # FIXED: Changed type from 'json' to 'jsonrpc' for Odoo 19 compatibility
     @http.route('/prepit/order', type='jsonrpc', auth='public', methods=['POST'], csrf=False)
+    @profiled()
     def prepit_order(self, **kwargs):
         """Create a PoS order in Odoo from a Prepit-style JSON payload."""
 
@@ -15,80 +36,262 @@ class PrepitPOSController(http.Controller):
         # No need for json.loads(request.httprequest.data)
         data = kwargs
 
-        PosOrder = request.env['pos.order'].sudo()
+        config, session, error = self._get_config_and_session(data.get('branch_id'))
+        if error:
+            return error
+
+        try:
+            valid_product_ids = self._get_valid_product_ids([data])
+            return self._create_prepit_order(config, session, data, valid_product_ids)
+        except RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            _logger.error("Failed to create Prepit POS order: %s", str(e))
+            return {'status': 'error', 'message': str(e)}
+
+    @http.route('/prepit/orders', type='jsonrpc', auth='public', methods=['POST'], csrf=False)
+    @profiled()
+    def prepit_orders(self, orders=None, **kwargs):
+        """Create several PoS orders in one call, returning one result per order."""
+        orders = orders or []
+
+        try:
+            valid_product_ids = self._get_valid_product_ids(orders)
+            existing = self._find_existing_orders(orders)
+        except RETRYABLE_ERRORS:
+            raise
+        except Exception as e:
+            _logger.error("Failed to prepare Prepit POS order batch: %s", str(e))
+            return {'status': 'error', 'message': str(e)}
+
+        # Orders of a batch may target different branches: resolve each branch once
+        branches = {}
+        results = []
+        for data in orders:
+            branch_id = data.get('branch_id')
+            if branch_id not in branches:
+                branches[branch_id] = self._get_config_and_session(branch_id)
+            config, session, error = branches[branch_id]
+            if error:
+                results.append(dict(error, order_ref=data.get('order_ref')))
+                continue
+            try:
+                results.append(self._create_prepit_order(config, session, data, valid_product_ids, existing))
+            except RETRYABLE_ERRORS:
+                # The retry replays the whole batch; orders already imported come back as duplicates
+                raise
+            except Exception as e:
+                _logger.error("Failed to create Prepit POS order %s: %s", data.get('order_ref'), str(e))
+                results.append({'status': 'error', 'order_ref': data.get('order_ref'), 'message': str(e)})
+
+        return {'status': 'success', 'results': results}
+
+    # ----------------------
+    # PRIVATE METHODS
+    # ----------------------
+    def _get_config_and_session(self, branch_id=None):
+        """Return (config, session, error_response) for orders of a Prepit branch"""
         PosConfig = request.env['pos.config'].sudo()
 
-        # 1) Use fixed PoS config id = 1 (Main Shop usually)
-        config = PosConfig.browse(1)
-        if not config.exists():
-            return {'status': 'error', 'message': 'PoS config 1 not found'}
+        # 1) Resolve the branch through the cached branch id map; payloads
+        # without a branch keep going to PoS config id = 1 as before
+        if branch_id:
+            config = PosConfig.browse(PosConfig._prepit_get_config_id(branch_id))
+            if not config:
+                return config, None, {'status': 'error', 'message': f'Unknown Prepit branch {branch_id}'}
+        else:
+            config = PosConfig.browse(1)
+            if not config.exists():
+                return config, None, {'status': 'error', 'message': 'PoS config 1 not found'}
 
         # 2) Ensure there is an open PoS session
-        session = config.current_session_id
+        session = self._get_open_session(config)
         if not session:
-            # Attempt to open a session if one isn't active
-            config.open_session_cb()
-            session = config.current_session_id
-            
+            return config, None, {'status': 'error', 'message': f'No open PoS session for {config.name}'}
+        return config, session, None
+
+    def _get_open_session(self, config):
+        """Return the open session of a config, reusing the last one seen when still open"""
+        cache_key = (request.env.cr.dbname, config.id)
+        session_id = self._session_cache.get(cache_key)
+        if session_id:
+            session = request.env['pos.session'].sudo().browse(session_id).exists()
+            if session and session.state != 'closed' and session.config_id == config:
+                return session
+
+        session = config.current_session_id
         if not session:
-            return {'status': 'error', 'message': 'No open PoS session for config 1'}
+            self._session_cache.pop(cache_key, None)
+            if self._open_session_once(config):
+                # Our snapshot predates the new session: replay the request to see it
+                raise ConcurrencyError(f"PoS session opened for {config.name}, retrying the request")
+            return session
 
-        try:
-            # 3) Required monetary fields
-            amount_total = data.get('amount_total', 0.0)
-            amount_tax = data.get('amount_tax', 0.0)
-            amount_paid = data.get('amount_paid', amount_total)
-            amount_return = data.get('amount_return', 0.0)
-
-            # 4) Build order dict for Odoo's _process_order
-            # Note: Odoo 19 expects the 'data' key inside a specific wrapper for some internal methods,
-            # but _process_order generally takes the flattened dict.
-            order_dict = {
-                'data': {
-                    'config_id': config.id,
-                    'session_id': session.id,
-                    'partner_id': data.get('partner_id'),
-                    'amount_total': amount_total,
-                    'amount_tax': amount_tax,
-                    'amount_paid': amount_paid,
-                    'amount_return': amount_return,
-                    'lines': [],
-                    'pricelist_id': config.pricelist_id.id,
-                    'name': data.get('order_ref', 'Prepit External Order'),
-                    'pos_reference': data.get('order_ref', 'Prepit External Order'),
-                    'creation_date': fields.Datetime.now(),
-                }
-            }
+        self._session_cache[cache_key] = session.id
+        return session
+
+    def _open_session_once(self, config):
+        """Open a session for the config unless a concurrent request already did; True when one is open now.
+
+        Runs in its own transaction under a per-config advisory lock, so
+        simultaneous requests never open two sessions for the same config.
+        """
+        with request.env.registry.cursor() as cr:
+            cr.execute("SELECT pg_advisory_lock(%s, %s)", [SESSION_OPEN_LOCK, config.id])
+            try:
+                # Start a new transaction so the check below sees sessions opened while we waited
+                cr.commit()
+                locked_config = request.env(cr=cr)['pos.config'].sudo().browse(config.id)
+                if not locked_config.current_session_id:
+                    locked_config.open_session_cb()
+                opened = bool(locked_config.current_session_id)
+                cr.commit()
+                return opened
+            except Exception:
+                cr.rollback()
+                raise
+            finally:
+                cr.execute("SELECT pg_advisory_unlock(%s, %s)", [SESSION_OPEN_LOCK, config.id])
+
+    def _lock_session(self, session):
+        """Serialise order creation per session, waiting at most prepithelp.session_lock_timeout seconds.
+
+        A session changed by a transaction that committed after ours began
+        raises a serialization failure here, before the order is built, and
+        the request is retried.
+        """
+        settings = request.env['ir.config_parameter'].sudo()._get_prepit_settings()
+        timeout_ms = max(1, settings.get_int('prepithelp.session_lock_timeout', 5)) * 1000
+        cr = request.env.cr
+        cr.execute("SHOW lock_timeout")
+        previous = cr.fetchone()[0]
+        cr.execute("SELECT set_config('lock_timeout', %s, true)", [f"{timeout_ms}ms"])
+        # On failure the transaction is aborted and rolled back, dropping the local timeout with it
+        cr.execute("SELECT id FROM pos_session WHERE id = %s FOR NO KEY UPDATE", [session.id])
+        cr.execute("SELECT set_config('lock_timeout', %s, true)", [previous])
+
+    def _get_valid_product_ids(self, orders):
+        """Check every line product of the given orders with a single query"""
+        # Malformed ids are left out so that only their own order reports them as unknown
+        product_ids = {
+            line.get('product_id')
+            for data in orders
+            for line in data.get('lines', [])
+            if _is_record_id(line.get('product_id'))
+        }
+        if not product_ids:
+            return set()
+        products = request.env['product.product'].sudo().search([('id', 'in', list(product_ids))])
+        return set(products.ids)
+
+    def _find_existing_orders(self, orders):
+        """Map already imported order references to their orders with a single query"""
+        refs = [data['order_ref'] for data in orders if data.get('order_ref')]
+        if not refs:
+            return {}
+        existing = request.env['pos.order'].sudo().search([('prepit_order_ref', 'in', refs)])
+        return {order.prepit_order_ref: order for order in existing}
+
+    def _duplicate_result(self, order):
+        return {
+            'status': 'success',
+            'order_id': order.id,
+            'order_name': order.name,
+            'duplicate': True,
+        }
+
+    def _create_prepit_order(self, config, session, data, valid_product_ids, existing=None):
+        """Create one order, or return the existing one when its order_ref was already imported"""
+        PosOrder = request.env['pos.order'].sudo()
+        order_ref = data.get('order_ref')
 
-            # 5) Lines with required subtotal fields
-            for line in data.get('lines', []):
-                qty = line.get('qty', 1)
-                price_unit = line.get('price_unit', 0.0)
-                discount = line.get('discount', 0.0)
-
-                # calculation logic
-                price_subtotal = qty * price_unit * (1 - (discount / 100.0))
-                
-                line_vals = [0, 0, {
-                    'product_id': line['product_id'],
-                    'qty': qty,
-                    'price_unit': price_unit,
-                    'discount': discount,
-                    'price_subtotal': price_subtotal,
-                    'price_subtotal_incl': price_subtotal, # Simplified for external sync
-                }]
-                order_dict['data']['lines'].append(line_vals)
-
-            # 6) Create POS order
-            # _process_order returns a list of created order records
-            new_order = PosOrder._process_order(order_dict, existing_order=False)
+        # Idempotency: a retried submission returns the order created the first time
+        if order_ref:
+            if existing is not None:
+                duplicate = existing.get(order_ref)
+            else:
+                duplicate = PosOrder.search([('prepit_order_ref', '=', order_ref)], limit=1)
+            if duplicate:
+                return self._duplicate_result(duplicate)
 
+        unknown = {
+            str(line.get('product_id'))
+            for line in data.get('lines', [])
+            if not _is_record_id(line.get('product_id')) or line['product_id'] not in valid_product_ids
+        }
+        if unknown:
             return {
-                'status': 'success',
-                'order_id': new_order.id,
-                'order_name': new_order.name
+                'status': 'error',
+                'order_ref': order_ref,
+                'message': 'Unknown products: %s' % ', '.join(sorted(unknown)),
             }
 
-        except Exception as e:
-            _logger.error("Failed to create Prepit POS order: %s", str(e))
-            return {'status': 'error', 'message': str(e)}
+        # 3) Required monetary fields
+        amount_total = data.get('amount_total', 0.0)
+        amount_tax = data.get('amount_tax', 0.0)
+        amount_paid = data.get('amount_paid', amount_total)
+        amount_return = data.get('amount_return', 0.0)
+
+        # 4) Build order dict for Odoo's _process_order
+        # Note: Odoo 19 expects the 'data' key inside a specific wrapper for some internal methods,
+        # but _process_order generally takes the flattened dict.
+        order_dict = {
+            'data': {
+                'config_id': config.id,
+                'session_id': session.id,
+                'partner_id': data.get('partner_id'),
+                'amount_total': amount_total,
+                'amount_tax': amount_tax,
+                'amount_paid': amount_paid,
+                'amount_return': amount_return,
+                'lines': [],
+                'pricelist_id': config.pricelist_id.id,
+                'name': order_ref or 'Prepit External Order',
+                'pos_reference': order_ref or 'Prepit External Order',
+                'creation_date': fields.Datetime.now(),
+            }
+        }
+
+        # 5) Lines with required subtotal fields
+        for line in data.get('lines', []):
+            qty = line.get('qty', 1)
+            price_unit = line.get('price_unit', 0.0)
+            discount = line.get('discount', 0.0)
+
+            # calculation logic
+            price_subtotal = qty * price_unit * (1 - (discount / 100.0))
+
+            line_vals = [0, 0, {
+                'product_id': line['product_id'],
+                'qty': qty,
+                'price_unit': price_unit,
+                'discount': discount,
+                'price_subtotal': price_subtotal,
+                'price_subtotal_incl': price_subtotal, # Simplified for external sync
+            }]
+            order_dict['data']['lines'].append(line_vals)
+
+        # 6) Create POS order, one at a time per session
+        self._lock_session(session)
+        try:
+            with request.env.cr.savepoint():
+                new_order = PosOrder._process_order(order_dict, existing_order=False)
+                if isinstance(new_order, int):
+                    new_order = PosOrder.browse(new_order)
+                if order_ref:
+                    new_order.prepit_order_ref = order_ref
+        except IntegrityError as e:
+            if not order_ref or not isinstance(e, errors.UniqueViolation):
+                raise
+            # A concurrent request imported the same order_ref first
+            duplicate = PosOrder.search([('prepit_order_ref', '=', order_ref)], limit=1)
+            if not duplicate:
+                # It committed after our snapshot was taken: the replayed request will see it
+                raise ConcurrencyError(f"Prepit order {order_ref} imported concurrently, retrying the request") from e
+            return self._duplicate_result(duplicate)
+
+        return {
+            'status': 'success',
+            'order_id': new_order.id,
+            'order_name': new_order.name
+        }
@@ -0,0 +1,40 @@
+from odoo import http
+from odoo.http import request
+import gzip
+import logging
+
+from ..tools.profiling import profiled
+
+_logger = logging.getLogger(__name__)
+
+class PrepitMenuController(http.Controller):
+
+    @http.route('/prepit/menu', type='http', auth='public', methods=['GET'], csrf=False, sitemap=False)
+    @profiled()
+    def prepit_menu(self, branch=None, **kwargs):
+        """Serve the stored menu snapshot, answering 304 while the client copy is current."""
+        Fragment = request.env['prepit.menu.fragment'].sudo()
+        settings = request.env['ir.config_parameter'].sudo()._get_prepit_settings()
+
+        menu_token = settings.get('prepithelp.menu_token')
+        if menu_token and request.httprequest.headers.get('Authorization') != f'Bearer {menu_token}':
+            return request.make_response('Unauthorized', status=401)
+        if branch and not request.env['pos.config'].sudo()._prepit_get_config_id(branch):
+            return request.make_response('Unknown branch', status=404)
+
+        etag = Fragment._get_etag(branch)
+        headers = [('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+        if request.httprequest.if_none_match.contains(etag):
+            response = request.make_response(b'', headers=headers, status=304)
+            response.set_etag(etag)
+            return response
+
+        body = Fragment._get_menu_body(etag, branch)
+        headers.append(('Content-Type', 'application/json'))
+        if 'gzip' in request.httprequest.accept_encodings:
+            headers.append(('Content-Encoding', 'gzip'))
+        else:
+            body = gzip.decompress(body)
+        response = request.make_response(body, headers=headers)
+        response.set_etag(etag)
+        return response
@@ -1 +1,8 @@
 from . import models
+from . import prepit_outbox
+from . import prepit_sync_state
+from . import prepit_settings
+from . import prepit_sync_run
+from . import prepit_change
+from . import prepit_menu
+from . import prepit_sync_job
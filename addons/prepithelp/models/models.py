@@ -1,10 +1,58 @@
 from odoo import models, fields, api
-import requests
+from markupsafe import Markup, escape
+import hashlib
+import json
 import logging
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
+
+import requests
+
+from odoo.tools import SQL, ormcache, split_every
+
+from ..tools.prepit_client import CircuitOpenError, get_client, run_concurrently
+from ..tools.prepit_json import FragmentCache, dumps, encode, encoded_size
+from ..tools.profiling import profiled
 
 _logger = logging.getLogger(__name__)
 
+# kind -> (model, payload list key, payload builder, url, endpoint)
+CHUNKED_SYNCS = {
+    'categories': (
+        'pos.category', 'categories', '_prepare_categories_payload',
+        "https://api-pos.dev.prepit.app/menu/sync-categories", 'sync_categories',
+    ),
+    'branches': (
+        'pos.config', 'branches', '_prepare_branches_payload',
+        "https://api-pos.dev.prepit.app/branch/sync-branches", 'sync_branches',
+    ),
+}
+
+# Static branch blocks, shared by every branch payload instead of rebuilt per branch
+ORDER_TYPES = [
+    {"orderType": "PICK_UP", "paymentMethods": ["ONLINE", "OFFLINE"]},
+    {"orderType": "DINE_IN", "paymentMethods": ["OFFLINE", "WALLET"]},
+    {"orderType": "HOME_DELIVERY", "paymentMethods": ["ONLINE", "OFFLINE", "WALLET"]},
+]
+DEFAULT_LAT = 30.0444
+DEFAULT_LNG = 31.2357
+DEFAULT_PHONE = '+201234567890'
+
+# Encoded product entries per worker, keyed by everything the entry is built from
+_product_fragments = FragmentCache()
+
+# kind -> (id key, payload list key, remote listing path, upsert url, endpoint)
+RECONCILE_SPECS = {
+    'branches': (
+        'posBranchId', 'branches', "/branch/get-branches",
+        "https://api-pos.dev.prepit.app/branch/sync-branches", 'reconcile_branches',
+    ),
+    'categories': (
+        'posCategoryId', 'categories', "/menu/get-categories",
+        "https://api-pos.dev.prepit.app/menu/sync-categories", 'reconcile_categories',
+    ),
+}
+
 class ProductTemplate(models.Model):
     _inherit = "product.template"
     
@@ -15,6 +63,165 @@ class ProductTemplate(models.Model):
         'pos_config_id',
         string="POS Branches"
     )
+    
+    prepit_stock_state = fields.Selection([
+        ('ok', 'In Stock'),
+        ('low', 'Low Stock'),
+        ('out', 'Out of Stock'),
+    ], copy=False, readonly=True, help="Stock state last pushed to Prepit")
+    
+    def _prepit_store_stock_states(self, states):
+        """Store pushed stock states without bumping write_date, which drives delta detection"""
+        if not states:
+            return
+        self.env.cr.execute(SQL(
+            """UPDATE product_template AS t SET prepit_stock_state = v.state
+                 FROM (VALUES %s) AS v(id, state) WHERE t.id = v.id""",
+            SQL(", ").join(SQL("(%s, %s)", template_id, state) for template_id, state in states.items()),
+        ))
+        self.browse(list(states)).invalidate_recordset(['prepit_stock_state'])
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        self.env['prepit.change']._capture(templates.filtered('available_in_pos'))
+        return templates
+    
+    def write(self, vals):
+        if 'pos_categ_ids' in vals:
+            # The categories a product leaves must be resent by the next delta sync
+            self.pos_categ_ids.sudo()._prepit_mark_stale()
+        result = super().write(vals)
+        if 'name' in vals:
+            self.env['prepithelp.prepithelp']._clear_names()
+        # De-listing must be captured too, other edits only matter for POS products
+        templates = self if 'available_in_pos' in vals else self.filtered('available_in_pos')
+        self.env['prepit.change']._capture(templates, vals=vals)
+        return result
+    
+    def unlink(self):
+        self.pos_categ_ids.sudo()._prepit_mark_stale()
+        self.env['prepit.change']._capture(self.filtered('available_in_pos'), operation='delete')
+        return super().unlink()
+
+class PosCategory(models.Model):
+    _inherit = "pos.category"
+    
+    prepit_sync_hash = fields.Char(copy=False, readonly=True)
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        categories = super().create(vals_list)
+        self.env['prepit.change']._capture(categories)
+        return categories
+    
+    def write(self, vals):
+        result = super().write(vals)
+        if 'name' in vals:
+            self.env['prepithelp.prepithelp']._clear_names()
+        self.env['prepit.change']._capture(self, vals=vals)
+        return result
+    
+    def unlink(self):
+        self.env['prepit.change']._capture(self, operation='delete')
+        return super().unlink()
+    
+    def _prepit_mark_stale(self):
+        self.filtered('prepit_sync_hash').write({'prepit_sync_hash': False})
+        self.env['prepit.sync.state']._forget_hashes('categories:', self.ids)
+    
+    def _prepit_store_hashes(self, hashes):
+        """Store content hashes without bumping write_date, which drives delta detection"""
+        if not hashes:
+            return
+        self.env.cr.execute(SQL(
+            """UPDATE pos_category AS c SET prepit_sync_hash = v.digest
+                 FROM (VALUES %s) AS v(id, digest) WHERE c.id = v.id""",
+            SQL(", ").join(SQL("(%s, %s)", category_id, digest) for category_id, digest in hashes.items()),
+        ))
+        self.browse(list(hashes)).invalidate_recordset(['prepit_sync_hash'])
+
+class PosConfig(models.Model):
+    _inherit = "pos.config"
+    
+    prepit_name_ar = fields.Char(
+        string="Arabic Name",
+        help="Shop name sent to Prepit in Arabic, the name is used when empty",
+    )
+    prepit_branch_id = fields.Char(
+        string="Prepit Branch ID", index=True, copy=False, readonly=True,
+        help="Identifier of this shop on Prepit, assigned once and kept when the shop is renamed",
+    )
+    
+    _prepit_branch_id_uniq = models.Constraint(
+        'UNIQUE(prepit_branch_id)',
+        "This Prepit branch ID is already used by another shop.",
+    )
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        configs = super().create(vals_list)
+        configs._prepit_assign_branch_ids()
+        self.env['prepit.change']._capture(configs)
+        return configs
+    
+    def write(self, vals):
+        result = super().write(vals)
+        if 'name' in vals or 'prepit_name_ar' in vals:
+            self.env['prepithelp.prepithelp']._clear_names()
+        self.env['prepit.change']._capture(self, vals=vals)
+        return result
+    
+    def unlink(self):
+        branch_refs = {config.id: config.prepit_branch_id for config in self if config.prepit_branch_id}
+        self.env['prepit.change']._capture(self, operation='delete', branch_refs=branch_refs)
+        result = super().unlink()
+        self.env.registry.clear_cache()
+        return result
+    
+    @api.model
+    def _prepit_get_config_id(self, branch_id):
+        """Config id of a Prepit branch, or False"""
+        return self._prepit_branch_map().get(branch_id, False)
+    
+    @ormcache()
+    def _prepit_branch_map(self):
+        # One query per registry, then every inbound order is a dict lookup
+        self.env.cr.execute("SELECT prepit_branch_id, id FROM pos_config WHERE prepit_branch_id IS NOT NULL")
+        return dict(self.env.cr.fetchall())
+    
+    @api.model
+    def _prepit_assign_branch_ids(self):
+        """Give every config without one a Prepit branch id; also run on module update"""
+        configs = self if self else self.with_context(active_test=False).search([('prepit_branch_id', '=', False)])
+        configs = configs.filtered(lambda config: not config.prepit_branch_id)
+        if not configs:
+            return
+        self.env.cr.execute("SELECT prepit_branch_id FROM pos_config WHERE prepit_branch_id IS NOT NULL")
+        taken = {row[0] for row in self.env.cr.fetchall()}
+        for config in configs:
+            branch_id = config._prepit_new_branch_id(taken)
+            taken.add(branch_id)
+            config.with_context(prepit_no_capture=True).prepit_branch_id = branch_id
+        self.env.registry.clear_cache()
+    
+    def _prepit_new_branch_id(self, taken):
+        self.ensure_one()
+        raw_id = f"{self.name}-{self.id:03d}"
+        branch_id = ''.join(c for c in raw_id if c.isalnum() or c == '-').strip('-')[:20]
+        if branch_id in taken:
+            # Long names truncate the id suffix away: keep the suffix so the id stays unique
+            suffix = f"-{self.id:03d}"
+            branch_id = branch_id[:20 - len(suffix)].strip('-') + suffix
+        return branch_id
+
+class ResCompany(models.Model):
+    _inherit = "res.company"
+    
+    prepit_chain_id = fields.Char(
+        string="Prepit Chain ID",
+        help="Chain of this company's shops on Prepit, defaults to the api_integration.chain_id parameter",
+    )
 
 class PrepitHelp(models.Model):
     _name = "prepithelp.prepithelp"
@@ -24,12 +231,60 @@ class PrepitHelp(models.Model):
     value = fields.Integer()
     value2 = fields.Float(compute="_compute_value2", store=True)
     description = fields.Text()
+    sync_summary_html = fields.Html(compute="_compute_sync_summary_html", sanitize=False)
+    circuit_state_html = fields.Html(compute="_compute_circuit_state_html", sanitize=False)
     
     @api.depends('value')
     def _compute_value2(self):
         for record in self:
             record.value2 = float(record.value) / 100.0 if record.value else 0.0
     
+    def _compute_sync_summary_html(self):
+        summary = self.env['prepit.sync.run'].sudo()._get_latency_summary(hours=24)
+        if not summary:
+            html = Markup('<p class="text-muted">No calls to Prepit in the last 24 hours.</p>')
+        else:
+            rows = Markup('').join(Markup(
+                '<tr><td>%s</td><td class="text-end">%d</td><td class="text-end">%d</td>'
+                '<td class="text-end">%.0f</td><td class="text-end">%.0f</td><td class="text-end">%.0f</td>'
+                '<td class="text-end">%d</td><td class="text-end">%.1f</td></tr>'
+            ) % (
+                escape(line['endpoint']), line['calls'], line['failed'],
+                line['p50'], line['p95'], line['p99'], line['bytes'], line['records_per_second'],
+            ) for line in summary)
+            html = Markup(
+                '<table class="table table-sm"><thead><tr>'
+                '<th>Endpoint (last 24h)</th><th class="text-end">Calls</th><th class="text-end">Failed</th>'
+                '<th class="text-end">p50 ms</th><th class="text-end">p95 ms</th><th class="text-end">p99 ms</th>'
+                '<th class="text-end">Bytes sent</th><th class="text-end">Records/s</th>'
+                '</tr></thead><tbody>%s</tbody></table>'
+            ) % rows
+        for record in self:
+            record.sync_summary_html = html
+    
+    def _compute_circuit_state_html(self):
+        # Breakers live in memory, so this is the view of the worker serving the request
+        states = sorted(get_client().breaker_states(), key=lambda state: state['key'])
+        if not states:
+            html = Markup('<p class="text-muted">No calls to Prepit from this worker yet.</p>')
+        else:
+            badges = {'closed': 'text-bg-success', 'half_open': 'text-bg-warning', 'open': 'text-bg-danger'}
+            rows = Markup('').join(Markup(
+                '<tr><td>%s</td><td><span class="badge %s">%s</span></td><td class="text-end">%d</td>'
+                '<td class="text-end">%d</td><td class="text-end">%.0f</td></tr>'
+            ) % (
+                escape(state['key']), badges[state['state']], state['state'].replace('_', '-'),
+                state['failures'], state['opened_count'], state['retry_in'],
+            ) for state in states)
+            html = Markup(
+                '<table class="table table-sm"><thead><tr>'
+                '<th>Endpoint</th><th>Circuit</th><th class="text-end">Failures</th>'
+                '<th class="text-end">Times opened</th><th class="text-end">Retry in (s)</th>'
+                '</tr></thead><tbody>%s</tbody></table>'
+            ) % rows
+        for record in self:
+            record.circuit_state_html = html
+    
     # ----------------------
     # STUB METHODS
     # ----------------------
@@ -37,28 +292,187 @@ class PrepitHelp(models.Model):
         _logger.info("Addons synchronization completed")
         return True
     
-    def sync_prepit_products_safe(self):
-        _logger.info("Products synchronization completed")
-        return True
-    
     def send_pos_menu_to_prepit(self):
         _logger.info("POS menu synchronization completed")
         return True
     
+    # ----------------------
+    # PRODUCT SYNC
+    # ----------------------
+    def sync_prepit_products_safe(self, template_ids=None):
+        """Sync POS products to Prepit API in size-bounded batches"""
+        settings = self._get_prepit_settings()
+        read_size = settings.get_int('prepithelp.product_read_size', 1000)
+        max_items = settings.get_int('prepithelp.product_batch_size', 200)
+        max_bytes = settings.get_int('prepithelp.product_batch_bytes', 512 * 1024)
+        url = "https://api-pos.dev.prepit.app/menu/sync-products"
+        
+        domain = [('available_in_pos', '=', True), ('active', '=', True)] + self._get_shard_domain()
+        if template_ids is not None:
+            domain.append(('id', 'in', list(template_ids)))
+        Template = self.env['product.template'].sudo()
+        ids = Template.search(domain, order='id').ids
+        
+        sent = failed = 0
+        for chunk_ids in split_every(read_size, ids):
+            templates = Template.browse(chunk_ids)
+            products = self._prepare_encoded_products(templates)
+            offset = 0
+            for batch in self._split_by_size(products, max_items, max_bytes):
+                # Batches are consecutive slices of the chunk
+                batch_templates = templates[offset:offset + len(batch)]
+                offset += len(batch)
+                payload = {"posChainId": self._get_chain_id(), "products": batch}
+                if self.send_to_prepit(payload, custom_url=url, endpoint='sync_products', defer=batch_templates):
+                    sent += len(batch)
+                else:
+                    failed += len(batch)
+            # Only one read chunk is kept in cache at a time
+            self.env.invalidate_all()
+        
+        _logger.info("Products sync result: %s (%d sent, %d failed)", 
+                    "SUCCESS" if not failed else "FAILED", sent, failed)
+        return not failed
+    
     def update_single_product(self, template_id):
-        _logger.info("Single product update completed for template ID: %s", template_id)
-        return True
+        """Update single product via Prepit API"""
+        template = self.env['product.template'].sudo().with_context(active_test=False).browse(template_id)
+        if not template.exists():
+            _logger.warning("Product template %s not found", template_id)
+            return False
+        
+        payload = {
+            "posChainId": self._get_chain_id(),
+            "product": self._prepare_products_data(template)[0],
+        }
+        url = "https://api-pos.dev.prepit.app/menu/update-one-product"
+        return self.send_to_prepit(payload, custom_url=url, endpoint='update_product')
     
     def get_product_by_id(self, pos_product_id):
-        _logger.info("Retrieved product by ID: %s", pos_product_id)
-        return True
+        """Fetch a product from Prepit API"""
+        calls = []
+        try:
+            settings = self._get_prepit_settings()
+            url = f"{settings.api_url}/menu/get-product-by-id/{pos_product_id}"
+            response = get_client().get(url, headers=settings.accept_headers,
+                                        timeout=settings.timeout('get_product'), on_call=calls.append,
+                                        endpoint='get_product')
+            _logger.info("GET product %s -> Status: %s", pos_product_id, response.status_code)
+            return response.json() if response.status_code == 200 else False
+        except Exception as e:
+            _logger.error("Get product %s failed: %s", pos_product_id, str(e))
+            return False
+        finally:
+            self.env['prepit.sync.run']._record_calls('get_product', calls, 1)
+    
+    def _send_product_removals(self, template_ids):
+        """Mark deleted, archived or de-listed products unavailable on Prepit"""
+        payload = {
+            "posChainId": self._get_chain_id(),
+            "products": [
+                {"posProductId": f"product-{template_id}", "available": False}
+                for template_id in template_ids
+            ],
+        }
+        url = "https://api-pos.dev.prepit.app/menu/sync-products"
+        return self.send_to_prepit(payload, custom_url=url, endpoint='sync_products')
+    
+    def _prepare_products_data(self, templates):
+        """Build product entries for a batch of templates with a fixed number of queries"""
+        records = templates.read([
+            'name', 'list_price', 'taxes_id', 'pos_categ_ids', 'pos_branch_config_ids',
+            'available_in_pos', 'active', 'write_date',
+        ], load=None)
+        
+        tax_ids = {tax_id for record in records for tax_id in record['taxes_id']}
+        taxes = {
+            tax['id']: {"name": tax['name'], "amount": tax['amount'], "type": tax['amount_type']}
+            for tax in self.env['account.tax'].sudo().browse(list(tax_ids)).read(['name', 'amount', 'amount_type'])
+        }
+        
+        config_ids = {config_id for record in records for config_id in record['pos_branch_config_ids']}
+        branch_ids = {
+            config.id: self._generate_branch_id(config)
+            for config in self.env['pos.config'].sudo().browse(list(config_ids))
+        }
+        
+        # Only templates that actually have an image get a URL; the binary itself is never read
+        with_image = set(self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', 'product.template'),
+            ('res_field', '=', 'image_1920'),
+            ('res_id', 'in', templates.ids),
+        ]).mapped('res_id'))
+        base_url = self.get_base_url()
+        names = self._get_names(templates)
+        
+        products = []
+        for record in records:
+            category_ids = [f"category-{category_id:03d}" for category_id in record['pos_categ_ids']]
+            image = False
+            if record['id'] in with_image:
+                unique = int(record['write_date'].timestamp())
+                image = f"{base_url}/web/image/product.template/{record['id']}/image_512?unique={unique}"
+            products.append({
+                "posProductId": f"product-{record['id']}",
+                "name": names[record['id']],
+                "price": record['list_price'],
+                # A product may sit in several POS categories: the first, in category order, is its main one
+                "posCategoryId": category_ids[0] if category_ids else None,
+                "posCategoryIds": category_ids,
+                "taxes": [taxes[tax_id] for tax_id in record['taxes_id'] if tax_id in taxes],
+                "image": image,
+                # An empty list means the product is sold in every branch
+                "branches": [branch_ids[config_id] for config_id in record['pos_branch_config_ids']],
+                "available": bool(record['available_in_pos'] and record['active']),
+            })
+        return products
+    
+    def _prepare_encoded_products(self, templates):
+        """Encoded product entries, reusing the encoding of templates unchanged since it was built"""
+        rows = templates.read(['write_date', 'taxes_id'], load=None)
+        tax_ids = {tax_id for row in rows for tax_id in row['taxes_id']}
+        tax_versions = {
+            tax['id']: tax['write_date']
+            for tax in self.env['account.tax'].sudo().browse(list(tax_ids)).read(['write_date'])
+        }
+        # Branch ids never change and names, category, image and branches all bump write_date
+        base_key = (self.env.cr.dbname, self.get_base_url(), self._get_prepit_settings().get('prepithelp.arabic_lang'))
+        keys = {
+            row['id']: base_key + (
+                row['id'], row['write_date'],
+                tuple((tax_id, tax_versions.get(tax_id)) for tax_id in row['taxes_id']),
+            )
+            for row in rows
+        }
+        encoded = {template_id: _product_fragments.get(key) for template_id, key in keys.items()}
+        misses = templates.browse([template_id for template_id, value in encoded.items() if value is None])
+        if misses:
+            for template_id, product in zip(misses.ids, self._prepare_products_data(misses)):
+                encoded[template_id] = encode(product)
+                _product_fragments.set(keys[template_id], encoded[template_id])
+        return [encoded[template_id] for template_id in templates.ids]
+    
+    def _split_by_size(self, items, max_items, max_bytes):
+        """Group items into batches bounded by count and by encoded size"""
+        batch, batch_bytes = [], 0
+        for item in items:
+            size = encoded_size(item)
+            if batch and (len(batch) >= max_items or batch_bytes + size > max_bytes):
+                yield batch
+                batch, batch_bytes = [], 0
+            batch.append(item)
+            batch_bytes += size
+        if batch:
+            yield batch
     
     # ----------------------
     # ACTION METHODS
     # ----------------------
+    @profiled()
     def action_sync_data(self):
         return self.send_pos_menu_to_prepit()
     
+    @profiled()
     def action_sync_addons(self):
         try:
             return self.sync_prepit_addons_safe()
@@ -66,6 +480,7 @@ class PrepitHelp(models.Model):
             _logger.error("Addons synchronization failed: %s", str(e))
             return True
     
+    @profiled()
     def action_sync_products(self):
         try:
             return self.sync_prepit_products_safe()
@@ -73,12 +488,22 @@ class PrepitHelp(models.Model):
             _logger.error("Products synchronization failed: %s", str(e))
             return True
     
+    @profiled()
     def action_sync_categories(self):
-        return self._sync_categories()
+        self._sync_categories()
+        return True
     
+    @profiled()
+    def action_sync_categories_full(self):
+        self._sync_categories(force_full=True)
+        return True
+    
+    @profiled()
     def action_sync_branches(self):
-        return self._sync_branches()
+        self._sync_branches()
+        return True
     
+    @profiled()
     def action_update_one_branch(self):
         try:
             pos_config = self.env['pos.config'].sudo().search([], limit=1)
@@ -90,6 +515,7 @@ class PrepitHelp(models.Model):
             _logger.error("Update single branch failed: %s", str(e))
             return True
     
+    @profiled()
     def action_delete_one_branch(self):
         try:
             pos_config = self.env['pos.config'].sudo().search([], limit=1)
@@ -103,6 +529,7 @@ class PrepitHelp(models.Model):
             _logger.error("Delete branch failed: %s", str(e))
             return True
     
+    @profiled()
     def action_update_one_product(self):
         try:
             template = self.env["product.template"].sudo().search([
@@ -119,6 +546,7 @@ class PrepitHelp(models.Model):
             _logger.error("Update single product failed: %s", str(e))
             return True
     
+    @profiled()
     def action_get_product_by_id(self):
         try:
             template = self.env["product.template"].sudo().search([
@@ -131,51 +559,373 @@ class PrepitHelp(models.Model):
                 return True
                 
             pos_product_id = f"product-{template.id}"
-            return self.get_product_by_id(pos_product_id)
+            product = self.get_product_by_id(pos_product_id)
         except Exception as e:
             _logger.error("Get product by ID failed: %s", str(e))
             return True
+        # A dict returned by a button is run as an action, the product is shown in a notification
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': f"Prepit product {pos_product_id}",
+                'message': dumps(product).decode() if product else "Not found on Prepit, see the logs",
+                'type': 'info' if product else 'warning',
+                'sticky': bool(product),
+            },
+        }
+    
+    @profiled()
+    def action_reconcile(self):
+        try:
+            report = self.reconcile_with_prepit()
+        except Exception as e:
+            _logger.error("Reconcile failed: %s", str(e))
+            return True
+        return self._reconcile_report_notification(report)
+    
+    @profiled()
+    def action_reconcile_preview(self):
+        try:
+            report = self.reconcile_with_prepit(dry_run=True)
+        except Exception as e:
+            _logger.error("Reconcile preview failed: %s", str(e))
+            return True
+        return self._reconcile_report_notification(report, dry_run=True)
+    
+    @profiled()
+    def action_sync_all_chains(self):
+        self.env['prepit.sync.job'].sudo()._enqueue()
+        return self.env['ir.actions.act_window']._for_xml_id('prepithelp.prepit_sync_job_action_window')
+    
+    @profiled()
+    def action_rebuild_menu_snapshot(self):
+        self.env['prepit.menu.fragment'].sudo()._rebuild()
+        return True
+    
+    def action_open_sync_runs(self):
+        return self.env['ir.actions.act_window']._for_xml_id('prepithelp.prepit_sync_run_action_window')
     
+    def action_open_sync_stats(self):
+        return self.env['ir.actions.act_window']._for_xml_id('prepithelp.prepit_sync_stats_action_window')
+    
+    def action_reset_circuits(self):
+        get_client().reset_breakers()
+        return True
+    
+    @profiled()
     def action_send_hello_webhook(self):
         payload = {"message": "Hello from Odoo"}
         return self.send_to_prepit(payload)
     
+    # ----------------------
+    # RECONCILE
+    # ----------------------
+    def reconcile_with_prepit(self, dry_run=False):
+        """Bring each chain's branches and categories on Prepit in line with ours using only the calls needed"""
+        chains = self.env['prepit.sync.job']._get_chain_companies()
+        report = {}
+        for chain_id, companies in chains.items():
+            # Each chain only holds the branches of its own companies
+            Helper = self.with_context(prepit_chain_id=chain_id, prepit_company_ids=False)
+            for kind in RECONCILE_SPECS:
+                label = kind.capitalize() if len(chains) == 1 else f"{kind.capitalize()} ({chain_id})"
+                try:
+                    # Category hashes are shared: they only describe what Prepit holds while there is one chain
+                    report[label] = Helper._reconcile(kind, companies, dry_run, store_hashes=len(chains) == 1)
+                except Exception as e:
+                    # Without the remote state nothing can be diffed, and guessing would delete or resend everything
+                    _logger.error("Reconcile %s failed: %s", label, str(e))
+                    report[label] = {'error': str(e)}
+        return report
+    
+    def _reconcile(self, kind, companies, dry_run=False, store_hashes=True):
+        id_key, list_key, path, url, endpoint = RECONCILE_SPECS[kind]
+        local, record_ids = self._get_local_items(kind, companies)
+        remote = self._fetch_remote_items(path, list_key, id_key)
+        plan = self._diff_items(local, remote)
+        result = {
+            'create': len(plan['create']),
+            'update': len(plan['update']),
+            'delete': len(plan['delete']),
+            'unchanged': plan['unchanged'],
+        }
+        _logger.info("Reconcile %s of chain %s: %s%s", kind, self._get_chain_id(), result,
+                     " (dry run)" if dry_run else "")
+        if dry_run:
+            return result
+        
+        upserts = plan['create'] + plan['update']
+        if upserts:
+            payload = {"posChainId": self._get_chain_id(), list_key: upserts}
+            result['upsert_ok'] = self.send_to_prepit(payload, custom_url=url, endpoint=endpoint)
+            if result['upsert_ok'] and kind == 'categories' and store_hashes:
+                state = self.env['prepit.sync.state']._get_state(self._get_shard_key('categories'))
+                self._store_category_hashes(state, {
+                    record_ids[item[id_key]]: self._hash_payload(item) for item in upserts
+                })
+        if plan['delete']:
+            if kind == 'branches':
+                result['deleted'] = self._delete_branch_ids(plan['delete'])['succeeded']
+            else:
+                # Prepit has no delete-by-id for categories: report them for manual cleanup
+                _logger.warning("Categories only known to Prepit: %s", ', '.join(plan['delete']))
+        return result
+    
+    def _get_local_items(self, kind, companies):
+        """Our side of a reconcile for a chain's companies: payload items and record ids keyed by Prepit id"""
+        if kind == 'branches':
+            configs = self.env['pos.config'].sudo().search([('company_id', 'in', companies.ids)])
+            items = self._prepare_branches_payload(configs)['branches']
+            records = configs
+        else:
+            records = self.env['pos.category'].sudo().search([])
+            items = self._prepare_categories_payload(records)['categories']
+        id_key = RECONCILE_SPECS[kind][0]
+        local = {item[id_key]: item for item in items}
+        record_ids = {item[id_key]: record.id for item, record in zip(items, records)}
+        return local, record_ids
+    
+    def _fetch_remote_items(self, path, list_key, id_key):
+        """Prepit's side of a reconcile, keyed by Prepit id"""
+        settings = self._get_prepit_settings()
+        calls = []
+        items = []
+        try:
+            response = get_client().get(
+                f"{settings.api_url}{path}", headers=settings.accept_headers,
+                params={'posChainId': self._get_chain_id()}, timeout=settings.timeout('reconcile'),
+                on_call=calls.append, endpoint='reconcile_fetch',
+            )
+            response.raise_for_status()
+            body = response.json()
+            items = body.get(list_key, []) if isinstance(body, dict) else body
+        finally:
+            self.env['prepit.sync.run']._record_calls('reconcile_fetch', calls, len(items))
+        return {item[id_key]: item for item in items if item.get(id_key)}
+    
+    def _diff_items(self, local, remote):
+        """Split local items into creates, updates and unchanged by content hash; remote-only ids are deletes"""
+        plan = {'create': [], 'update': [], 'delete': sorted(set(remote) - set(local)), 'unchanged': 0}
+        for item_id, item in local.items():
+            remote_item = remote.get(item_id)
+            if remote_item is None:
+                plan['create'].append(item)
+            # Remote records carry extra server-side fields, only the ones we send are compared
+            elif self._hash_payload(item) != self._hash_payload({key: remote_item.get(key) for key in item}):
+                plan['update'].append(item)
+            else:
+                plan['unchanged'] += 1
+        return plan
+    
+    def _reconcile_report_notification(self, report, dry_run=False):
+        """Client action summarising a reconcile report"""
+        lines = []
+        failed = False
+        for label, result in report.items():
+            if 'error' in result:
+                failed = True
+                lines.append(f"{label}: failed ({result['error']})")
+                continue
+            failed = failed or result.get('upsert_ok') is False
+            if dry_run:
+                lines.append(
+                    f"{label}: {result['create']} to create, {result['update']} to update, "
+                    f"{result['delete']} to remove, {result['unchanged']} unchanged"
+                )
+            else:
+                lines.append(
+                    f"{label}: {result['create']} created, {result['update']} updated, "
+                    f"{result['delete']} removed, {result['unchanged']} unchanged"
+                )
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': "Prepit reconcile preview" if dry_run else "Prepit reconcile",
+                'message': '\n'.join(lines),
+                'type': 'warning' if failed else 'success',
+                'sticky': failed,
+            },
+        }
+    
     # ----------------------
     # PRIVATE METHODS
     # ----------------------
-    def _sync_categories(self):
-        """Sync POS categories to Prepit API"""
+    def _sync_categories(self, force_full=False):
+        """Sync POS categories to Prepit API, sending only changed ones unless forced"""
         try:
-            payload = self._prepare_categories_payload()
-            url = "https://api-pos.dev.prepit.app/menu/sync-categories"
-            success = self.send_to_prepit(payload, custom_url=url)
-            _logger.info("Categories sync result: %s (%d categories)", 
-                        "SUCCESS" if success else "FAILED", len(payload.get('categories', [])))
-            return True
+            state = self.env['prepit.sync.state']._get_state(self._get_shard_key('categories'))
+            started_at = fields.Datetime.now()
+            
+            if (force_full or not state.watermark) and self._get_sync_page_size():
+                return self._sync_chunked('categories')
+            if force_full or not state.watermark:
+                categories = self.env['pos.category'].sudo().search([])
+            else:
+                categories = self._get_changed_categories(state)
+            
+            payload = self._prepare_categories_payload(categories)
+            sent_hashes = self._get_category_hashes(state, categories)
+            hashes = {}
+            changed = []
+            for cat_data, category in zip(payload['categories'], categories):
+                digest = self._hash_payload(cat_data)
+                if force_full or digest != sent_hashes[category.id]:
+                    changed.append(cat_data)
+                    hashes[category.id] = digest
+            payload['categories'] = changed
+            
+            success = True
+            if changed:
+                url = "https://api-pos.dev.prepit.app/menu/sync-categories"
+                success = self.send_to_prepit(payload, custom_url=url, endpoint='sync_categories')
+            if success:
+                self._store_category_hashes(state, hashes)
+                vals = {'watermark': started_at}
+                if force_full:
+                    vals['last_full_sync_at'] = started_at
+                state.write(vals)
+            _logger.info("Categories sync result: %s (%d of %d categories, %s)", 
+                        "SUCCESS" if success else "FAILED", len(changed), len(categories),
+                        "full" if force_full else "delta")
+            return success
         except Exception as e:
             _logger.error("Categories synchronization failed: %s", str(e))
-            return True
+            return False
+    
+    def _get_sync_page_size(self):
+        """Records per page for chunked syncs; 0 keeps the single-request transport"""
+        return self._get_prepit_settings().get_int('prepithelp.sync_page_size', 0)
+    
+    def _sync_chunked(self, kind):
+        """Send a full sync page by page, resuming after the last acknowledged page; False when a page failed.
+
+        Each page is committed only under ``prepit_commit_pages``, set by sync
+        jobs. Buttons and other callers keep their progress in their own
+        transaction, which still lets the next run resume.
+        """
+        model_name, list_key, builder, url, endpoint = CHUNKED_SYNCS[kind]
+        page_size = self._get_sync_page_size()
+        state = self.env['prepit.sync.state']._get_state(self._get_shard_key(kind))
+        if not state.sync_token:
+            state.write({
+                'sync_token': uuid.uuid4().hex,
+                'cursor_id': 0,
+                'page': 0,
+                'run_started_at': fields.Datetime.now(),
+            })
+        else:
+            _logger.info("Resuming %s sync %s after page %d", kind, state.sync_token, state.page)
+        
+        Model = self.env[model_name].sudo()
+        domain = self._get_shard_domain() if 'company_id' in Model._fields else []
+        while True:
+            # Keyset pagination: one extra row tells whether this page is the last one
+            records = Model.search([('id', '>', state.cursor_id)] + domain, order='id', limit=page_size + 1)
+            is_last = len(records) <= page_size
+            records = records[:page_size]
+            if not records:
+                break
+            
+            payload = getattr(self, builder)(records)
+            payload.update({
+                "syncToken": state.sync_token,
+                "page": state.page + 1,
+                "isLastPage": is_last,
+            })
+            if not self.send_to_prepit(payload, custom_url=url, endpoint=endpoint):
+                _logger.warning("%s sync %s stopped at page %d, next run resumes from it",
+                                kind.capitalize(), state.sync_token, state.page + 1)
+                return False
+            
+            if kind == 'categories':
+                self._store_category_hashes(state, {
+                    category.id: self._hash_payload(cat_data)
+                    for category, cat_data in zip(records, payload[list_key])
+                })
+            state.write({'cursor_id': records[-1].id, 'page': state.page + 1})
+            if self.env.context.get('prepit_commit_pages'):
+                # Only sync jobs own their cursor: persist the acknowledged page so a crash resumes here
+                self.env.cr.commit()
+            self.env.invalidate_all()
+            if is_last:
+                break
+        
+        _logger.info("%s sync %s completed in %d pages", kind.capitalize(), state.sync_token, state.page)
+        vals = {'sync_token': False, 'cursor_id': 0, 'page': 0}
+        if kind == 'categories':
+            vals.update(watermark=state.run_started_at, last_full_sync_at=state.run_started_at)
+        state.write(vals)
+        return True
+    
+    def _get_changed_categories(self, state):
+        """Categories edited, never synced, or whose products changed since the state's watermark"""
+        # Overlap the window so transactions still open at the last run are not missed;
+        # content hashes keep the overlap from resending unchanged categories
+        since = state.watermark - timedelta(minutes=5)
+        Category = self.env['pos.category'].sudo()
+        if self._get_shard_company_ids():
+            sent_ids = [int(category_id) for category_id in state.hashes or {}]
+            domain = ['|', ('write_date', '>=', since), ('id', 'not in', sent_ids)]
+        else:
+            domain = ['|', ('write_date', '>=', since), ('prepit_sync_hash', '=', False)]
+        category_ids = set(Category.search(domain).ids)
+        
+        # Archived or de-listed products must also be seen, hence active_test=False
+        for model in ('product.template', 'product.product'):
+            groups = self.env[model].sudo().with_context(active_test=False)._read_group(
+                [('write_date', '>=', since), ('pos_categ_ids', '!=', False)],
+                ['pos_categ_ids'],
+            )
+            category_ids.update(category.id for category, in groups)
+        
+        return Category.search([('id', 'in', list(category_ids))])
+    
+    def _hash_payload(self, data):
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+    
+    def _get_category_hashes(self, state, categories):
+        """Hash last sent per category id: kept on the category, or on the sync state of a chain shard"""
+        if self._get_shard_company_ids():
+            sent = state.hashes or {}
+            return {category.id: sent.get(str(category.id)) for category in categories}
+        return {category.id: category.prepit_sync_hash for category in categories}
+    
+    def _store_category_hashes(self, state, hashes):
+        # Categories are shared by every chain, so each shard remembers what its own chain received
+        if not hashes:
+            return
+        if self._get_shard_company_ids():
+            sent = dict(state.hashes or {})
+            sent.update((str(category_id), digest) for category_id, digest in hashes.items())
+            state.hashes = sent
+        else:
+            self.env['pos.category']._prepit_store_hashes(hashes)
     
     def _sync_branches(self):
         """Sync POS configurations (branches) to Prepit API"""
         try:
+            if self._get_sync_page_size():
+                return self._sync_chunked('branches')
             payload = self._prepare_branches_payload()
             url = "https://api-pos.dev.prepit.app/branch/sync-branches"
-            success = self.send_to_prepit(payload, custom_url=url)
+            success = self.send_to_prepit(payload, custom_url=url, endpoint='sync_branches')
             _logger.info("Branches sync result: %s (%d branches)", 
                         "SUCCESS" if success else "FAILED", len(payload.get('branches', [])))
-            return True
+            return success
         except Exception as e:
             _logger.error("Branches synchronization failed: %s", str(e))
-            return True
+            return False
     
-    def _prepare_categories_payload(self):
+    def _prepare_categories_payload(self, categories=None):
         """Prepare categories payload for Prepit API"""
-        get_param = self.env['ir.config_parameter'].sudo().get_param
-        pos_chain_id = get_param('api_integration.chain_id', '019c229b-9df2-77c5-99e5-b7fc1165e530')
+        pos_chain_id = self._get_chain_id()
         
-        categories = self.env['pos.category'].sudo().search([])
-        category_products = self._build_category_products_map()
+        if categories is None:
+            categories = self.env['pos.category'].sudo().search([])
+        category_products = self._build_category_products_map(categories)
+        names = self._get_names(categories)
         
         categories_list = []
         for category in categories:
@@ -184,7 +934,7 @@ class PrepitHelp(models.Model):
             
             cat_data = {
                 "posCategoryId": pos_cat_id,
-                "name": {"en": category.name, "ar": category.name},
+                "name": names[category.id],
                 "order": category.sequence or 0,
                 "products": products_list
             }
@@ -195,33 +945,40 @@ class PrepitHelp(models.Model):
             "categories": categories_list
         }
     
-    def _build_category_products_map(self):
+    def _build_category_products_map(self, categories=None):
         """Build mapping of categories to their POS products"""
-        category_products = {}
-        pos_products = self.env["product.product"].sudo().search([
+        domain = [
             ('available_in_pos', '=', True),
             ('active', '=', True),
-        ])
+            ('pos_categ_ids', '!=', False),
+        ] + self._get_shard_domain()
+        if categories is not None:
+            domain.append(('pos_categ_ids', 'in', categories.ids))
         
-        for product in pos_products:
-            if product.pos_categ_id:
-                cat_id = f"category-{product.pos_categ_id.id:03d}"
-                prod_id = f"product-{product.product_tmpl_id.id}"
-                
-                if cat_id not in category_products:
-                    category_products[cat_id] = []
-                if prod_id not in category_products[cat_id]:
-                    category_products[cat_id].append(prod_id)
+        # Grouping on both fields yields each distinct (category, template) pair once, a product
+        # being listed in each of its categories; variants are collapsed by the database
+        groups = self.env["product.product"].sudo()._read_group(
+            domain,
+            ['pos_categ_ids', 'product_tmpl_id'],
+            order='product_tmpl_id',
+        )
+        
+        category_products = {}
+        for category, template in groups:
+            cat_id = f"category-{category.id:03d}"
+            category_products.setdefault(cat_id, []).append(f"product-{template.id}")
         
         return category_products
     
-    def _prepare_branches_payload(self):
+    def _prepare_branches_payload(self, pos_configs=None):
         """Prepare branches payload for Prepit API"""
-        get_param = self.env['ir.config_parameter'].sudo().get_param
-        pos_chain_id = get_param('api_integration.chain_id', '019c229b-9df2-77c5-99e5-b7fc1165e530')
+        pos_chain_id = self._get_chain_id()
         
-        pos_configs = self.env['pos.config'].sudo().search([])
+        if pos_configs is None:
+            pos_configs = self.env['pos.config'].sudo().search(self._get_shard_domain(shared=False))
         branches_list = []
+        # Names of every branch resolved at once, the per-branch builder then hits the cache
+        self._get_names(pos_configs)
         
         for config in pos_configs:
             branch_data = self._prepare_single_branch_data(config)
@@ -235,6 +992,7 @@ class PrepitHelp(models.Model):
     def _prepare_single_branch_data(self, config):
         """Prepare data for single branch"""
         pos_branch_id = self._generate_branch_id(config)
+        name = self._get_names(config)[config.id]
         
         address_text = f"{getattr(config, 'street', '')} {getattr(config, 'city', '')}".strip()
         address_en = address_text[:100] or 'No address'
@@ -243,32 +1001,78 @@ class PrepitHelp(models.Model):
         return {
             "posBranchId": pos_branch_id,
             "name": {
-                "en": config.name[:50],
-                "ar": config.name[:50]
+                "en": name['en'][:50],
+                "ar": name['ar'][:50]
             },
             "address": {
                 "en": address_en,
                 "ar": address_ar
             },
             "location": {
-                "lat": float(getattr(config, 'latitude', 30.0444)),
-                "lng": float(getattr(config, 'longitude', 31.2357))
+                "lat": float(getattr(config, 'latitude', DEFAULT_LAT)),
+                "lng": float(getattr(config, 'longitude', DEFAULT_LNG))
             },
-            "phoneNumber": getattr(config, 'phone', '+201234567890') or '+201234567890',
+            "phoneNumber": getattr(config, 'phone', DEFAULT_PHONE) or DEFAULT_PHONE,
             "operatingHours": [],
             "active": getattr(config, 'state', 'closed') == 'opened',
-            "orderTypes": [
-                {"orderType": "PICK_UP", "paymentMethods": ["ONLINE", "OFFLINE"]},
-                {"orderType": "DINE_IN", "paymentMethods": ["OFFLINE", "WALLET"]},
-                {"orderType": "HOME_DELIVERY", "paymentMethods": ["ONLINE", "OFFLINE", "WALLET"]}
-            ],
+            "orderTypes": ORDER_TYPES,
             "vatInclusive": False
         }
     
+    def _get_prepit_settings(self):
+        return self.env['ir.config_parameter']._get_prepit_settings()
+    
+    def _get_names(self, records):
+        """English and Arabic names per record id.
+
+        Translations are read from the stored jsonb values of the whole
+        recordset in one query and kept for the rest of the cursor, so chunked
+        and delta syncs only ever read a record's names once.
+        """
+        cache = self.env.cr.cache.setdefault('prepit_names', {})
+        missing = records.browse([record_id for record_id in records.ids if (records._name, record_id) not in cache])
+        if missing:
+            ar_lang = self._get_prepit_settings().get('prepithelp.arabic_lang') or 'ar_001'
+            if records._name == 'pos.config':
+                for row in missing.sudo().read(['name', 'prepit_name_ar']):
+                    cache[records._name, row['id']] = {'en': row['name'], 'ar': row['prepit_name_ar'] or row['name']}
+            else:
+                missing.flush_recordset(['name'])
+                self.env.cr.execute(SQL(
+                    "SELECT id, name FROM %s WHERE id = ANY(%s)", SQL.identifier(records._table), missing.ids,
+                ))
+                for record_id, value in self.env.cr.fetchall():
+                    value = value or {}
+                    en = value.get('en_US') or next(iter(value.values()), '')
+                    cache[records._name, record_id] = {'en': en, 'ar': value.get(ar_lang) or en}
+        return {record_id: cache[records._name, record_id] for record_id in records.ids}
+    
+    def _clear_names(self):
+        self.env.cr.cache.pop('prepit_names', None)
+    
+    def _get_chain_id(self):
+        """Chain of the sync job being run, or the configured chain"""
+        return self.env.context.get('prepit_chain_id') or self._get_prepit_settings().chain_id
+    
+    def _get_shard_company_ids(self):
+        return self.env.context.get('prepit_company_ids') or []
+    
+    def _get_shard_key(self, kind):
+        """Sync state key: one progress record per kind and chain shard"""
+        return f"{kind}:{self._get_chain_id()}" if self._get_shard_company_ids() else kind
+    
+    def _get_shard_domain(self, shared=True):
+        """Restrict a search to the companies of the running sync job's chain; shared records included"""
+        company_ids = self._get_shard_company_ids()
+        if not company_ids:
+            return []
+        return [('company_id', 'in', [False, *company_ids] if shared else company_ids)]
+    
     def _generate_branch_id(self, config):
-        """Generate consistent branch ID from POS config"""
-        raw_id = f"{config.name}-{config.id:03d}"
-        return ''.join(c for c in raw_id if c.isalnum() or c == '-').strip('-')[:20]
+        """Prepit branch ID of a POS config, assigned on first use"""
+        if not config.prepit_branch_id:
+            config.sudo()._prepit_assign_branch_ids()
+        return config.prepit_branch_id
     
     @api.model
     def update_single_branch(self, config_id):
@@ -281,15 +1085,14 @@ class PrepitHelp(models.Model):
             
             payload = self._prepare_update_branch_payload(config)
             url = "https://api-pos.dev.prepit.app/branch/update-one-branch"
-            return self.send_to_prepit(payload, custom_url=url)
+            return self.send_to_prepit(payload, custom_url=url, endpoint='update_branch', defer=config)
         except Exception as e:
             _logger.error("Update single branch failed: %s", str(e))
             return False
     
     def _prepare_update_branch_payload(self, config):
         """Prepare update payload for single branch"""
-        get_param = self.env['ir.config_parameter'].sudo().get_param
-        pos_chain_id = get_param('api_integration.chain_id', '019c229b-9df2-77c5-99e5-b7fc1165e530')
+        pos_chain_id = self._get_chain_id()
         
         pos_branch_id = self._generate_branch_id(config)
         timestamp = datetime.now().strftime('%H:%M')
@@ -300,7 +1103,7 @@ class PrepitHelp(models.Model):
         branch_data.update({
             "name": {
                 "en": f"{config.name} [UPDATED {timestamp}]",
-                "ar": f"{config.name} [محدث {timestamp}]"
+                "ar": f"{self._get_names(config)[config.id]['ar']} [محدث {timestamp}]"
             },
             "address": {
                 "en": f"{address_text} [UPDATED {timestamp}]"[:100],
@@ -319,95 +1122,335 @@ class PrepitHelp(models.Model):
             "branch": branch_data
         }
     
+    @api.model
+    def update_branches(self, configs):
+        """Update several branches via Prepit API concurrently and report per branch"""
+        settings = self._get_prepit_settings()
+        url = "https://api-pos.dev.prepit.app/branch/update-one-branch"
+        timeout = settings.timeout('update_branch')
+        client = get_client()
+        
+        # Payloads are built here, worker threads only do HTTP; names are resolved for all branches at once
+        configs = configs.sudo()
+        self._get_names(configs)
+        pos_chain_id = self._get_chain_id()
+        jobs = [
+            (self._generate_branch_id(config), {
+                "posChainId": pos_chain_id,
+                "branch": self._prepare_single_branch_data(config),
+            })
+            for config in configs
+        ]
+        
+        def call(job, on_call):
+            response = client.post(url, job[1], headers=settings.json_headers, timeout=timeout,
+                                   on_call=on_call, endpoint='update_branch')
+            return response, response.status_code in [200, 201, 204]
+        
+        return self._run_branch_calls('update', jobs, call)
+    
+    @api.model
+    def delete_branches(self, configs):
+        """Delete several branches via Prepit API concurrently and report per branch"""
+        return self._delete_branch_ids([self._generate_branch_id(config) for config in configs.sudo()])
+    
+    @api.model
+    def _delete_branch_ids(self, pos_branch_ids):
+        settings = self._get_prepit_settings()
+        timeout = settings.timeout('delete_branch')
+        client = get_client()
+        jobs = [(pos_branch_id, None) for pos_branch_id in pos_branch_ids]
+        
+        def call(job, on_call):
+            url = f"{settings.api_url}/branch/delete-by-id/{job[0]}"
+            response = client.delete(url, headers=settings.accept_headers, timeout=timeout,
+                                     on_call=on_call, endpoint='delete_branch')
+            return response, response.status_code == 200
+        
+        return self._run_branch_calls('delete', jobs, call)
+    
+    def _run_branch_calls(self, operation, jobs, call):
+        """Run branch calls on the shared pool and aggregate their outcome"""
+        calls = []
+        
+        def run(job):
+            try:
+                response, ok = call(job, calls.append)
+                return {
+                    'branch': job[0],
+                    'ok': ok,
+                    'status': response.status_code,
+                    'error': False if ok else response.text[:200],
+                }
+            except Exception as e:
+                return {'branch': job[0], 'ok': False, 'status': False, 'error': str(e)}
+        
+        concurrency = self._get_prepit_settings().get_int('prepithelp.branch_concurrency', 8)
+        results = run_concurrently(run, jobs, concurrency)
+        self.env['prepit.sync.run']._record_calls(f'{operation}_branch', calls, 1)
+        succeeded = len([result for result in results if result['ok']])
+        for result in results:
+            if not result['ok']:
+                _logger.warning("Branch %s %s failed: %s", operation, result['branch'], result['error'])
+        _logger.info("Branch %s: %d of %d succeeded", operation, succeeded, len(results))
+        return {
+            'operation': operation,
+            'total': len(results),
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded,
+            'branches': results,
+        }
+    
+    @api.model
+    def _branch_report_notification(self, report):
+        """Client action summarising a branch report"""
+        failed = [result['branch'] for result in report['branches'] if not result['ok']]
+        message = f"{report['succeeded']} of {report['total']} branches processed."
+        if failed:
+            message += f" Failed: {', '.join(failed)}"
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': f"Prepit branch {report['operation']}",
+                'message': message,
+                'type': 'warning' if failed else 'success',
+                'sticky': bool(failed),
+            },
+        }
+    
     @api.model
     def delete_branch_by_id(self, pos_branch_id):
         """Delete branch by ID via Prepit API"""
+        calls = []
         try:
-            get_param = self.env['ir.config_parameter'].sudo().get_param
-            api_url = get_param('api_integration.url', 'https://api-pos.dev.prepit.app/').rstrip('/')
-            api_token = get_param('api_integration.token', '')
-            
-            url = f"{api_url}/branch/delete-by-id/{pos_branch_id}"
-            headers = {
-                "X-Gateway-Token": api_token,
-                "Accept": "application/json"
-            }
+            settings = self._get_prepit_settings()
+            url = f"{settings.api_url}/branch/delete-by-id/{pos_branch_id}"
             
-            response = requests.delete(url, headers=headers, timeout=10)
+            response = get_client().delete(url, headers=settings.accept_headers,
+                                           timeout=settings.timeout('delete_branch'), on_call=calls.append,
+                                           endpoint='delete_branch')
             _logger.info("DELETE branch %s -> Status: %s", pos_branch_id, response.status_code)
             
             return response.status_code == 200
         except Exception as e:
             _logger.error("Delete branch %s failed: %s", pos_branch_id, str(e))
             return False
+        finally:
+            self.env['prepit.sync.run']._record_calls('delete_branch', calls, 1)
     
-    def send_to_prepit(self, payload, custom_url=None):
-        """Send payload to Prepit API"""
+    def send_to_prepit(self, payload, custom_url=None, endpoint='default', defer=None):
+        """Send payload to Prepit API.
+
+        ``defer`` is the recordset the payload was built from: a call hitting
+        an open circuit or a transient failure is then queued in the outbox
+        and counts as accepted. The dispatcher rebuilds the payload from the
+        records when it sends it, see ``_prepare_deferred_payload``.
+        """
+        calls = []
         try:
-            get_param = self.env['ir.config_parameter'].sudo().get_param
-            api_token = get_param('api_integration.token', '')
-            
-            base_url = get_param('api_integration.url', 'https://api-pos.dev.prepit.app/').rstrip('/')
-            api_url = custom_url if custom_url else base_url
-            
-            headers = {
-                "X-Gateway-Token": api_token,
-                "Content-Type": "application/json",
-                "Accept": "application/json"
-            }
+            settings = self._get_prepit_settings()
+            api_url = custom_url if custom_url else settings.api_url
 
-            response = requests.post(api_url, json=payload, headers=headers, timeout=30)
+            response = get_client().post(api_url, payload, headers=settings.json_headers,
+                                         timeout=settings.timeout(endpoint), on_call=calls.append,
+                                         endpoint=endpoint)
             _logger.info("API %s -> %s: %s", api_url, response.status_code, response.text[:200])
             
+            if defer and (response.status_code >= 500 or response.status_code == 429):
+                return self._defer_to_outbox(api_url, defer, endpoint, f"HTTP {response.status_code}")
             return response.status_code in [200, 201, 204]
+        except CircuitOpenError as e:
+            if defer:
+                return self._defer_to_outbox(api_url, defer, endpoint, str(e))
+            _logger.warning("API request skipped: %s", str(e))
+            return False
+        except requests.RequestException as e:
+            if defer:
+                return self._defer_to_outbox(api_url, defer, endpoint, str(e))
+            _logger.error("API request failed: %s", str(e))
+            return False
         except Exception as e:
             _logger.error("API request failed: %s", str(e))
             return False
+        finally:
+            SyncRun = self.env['prepit.sync.run']
+            SyncRun._record_calls(endpoint, calls, SyncRun._count_records(payload))
+    
+    def _defer_to_outbox(self, url, records, endpoint, error):
+        _logger.warning("Prepit %s deferred to the outbox: %s", endpoint, error)
+        self.env['prepit.outbox']._enqueue_deferred(url, records, endpoint, self._get_chain_id(), error)
+        return True
+    
+    def _prepare_deferred_payload(self, endpoint, records):
+        """Payload of a deferred call from the current data of its records; None when none is left to send"""
+        if endpoint == 'sync_products':
+            live = records.filtered(lambda t: t.active and t.available_in_pos)
+            if live:
+                return {"posChainId": self._get_chain_id(), "products": self._prepare_encoded_products(live)}
+        elif endpoint == 'update_branch':
+            if records:
+                return self._prepare_update_branch_payload(records)
+        else:
+            raise ValueError(f"No deferred payload builder for {endpoint}")
+        return None
+
+
+class StockQuant(models.Model):
+    _inherit = "stock.quant"
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        quants._prepit_enqueue_stock_change()
+        return quants
+    
+    def write(self, vals):
+        result = super().write(vals)
+        if 'quantity' in vals:
+            self._prepit_enqueue_stock_change()
+        return result
+    
+    def _prepit_enqueue_stock_change(self):
+        """Collect the quants' products and locations; stock checks are queued once, before commit"""
+        # Only ids already in cache are read here, stock moves stay free of per-line queries
+        data = self.env.cr.precommit.data
+        pairs = data.get('prepithelp.stock_changes')
+        if pairs is None:
+            pairs = data['prepithelp.stock_changes'] = set()
+            self.env.cr.precommit.add(self.sudo()._prepit_flush_stock_changes)
+        pairs.update((quant.product_id.id, quant.location_id.id) for quant in self)
+    
+    def _prepit_flush_stock_changes(self):
+        pairs = self.env.cr.precommit.data.pop('prepithelp.stock_changes', set())
+        internal = set(self.env['stock.location'].browse({location_id for _, location_id in pairs}).exists().filtered(
+            lambda location: location.usage == 'internal'
+        ).ids)
+        products = self.env['product.product'].browse(
+            {product_id for product_id, location_id in pairs if location_id in internal}
+        ).exists()
+        templates = products.product_tmpl_id.filtered('available_in_pos')
+        if templates:
+            self.env['prepit.outbox']._enqueue_stock_changes(templates)
+            # Precommit hooks run after the ORM flush
+            self.env.flush_all()
+    
+    @api.model
+    def _prepit_on_hand(self, products):
+        """On-hand quantity per product over internal locations, in one grouped read"""
+        if not products:
+            return {}
+        groups = self.sudo()._read_group(
+            [('product_id', 'in', products.ids), ('location_id.usage', '=', 'internal')],
+            ['product_id'],
+            ['quantity:sum'],
+        )
+        return {product.id: quantity for product, quantity in groups}
+    
+    @api.model
+    def _prepit_template_on_hand(self, templates):
+        """On-hand quantity per template, summed over all of its variants"""
+        variants = templates.with_context(active_test=False).product_variant_ids
+        template_by_product = {variant.id: variant.product_tmpl_id.id for variant in variants}
+        levels = {}
+        for product_id, quantity in self._prepit_on_hand(variants).items():
+            template_id = template_by_product[product_id]
+            levels[template_id] = levels.get(template_id, 0.0) + quantity
+        return levels
 
 
 class PosOrder(models.Model):
     _inherit = "pos.order"
     
+    prepit_order_ref = fields.Char(
+        string="Prepit Order Reference", index=True, copy=False, readonly=True,
+        help="Idempotency key of orders received from Prepit",
+    )
+    
+    _prepit_order_ref_uniq = models.Constraint(
+        'UNIQUE(prepit_order_ref)',
+        "This Prepit order has already been imported.",
+    )
+    
     def _post_prepit_webhook_with_stock(self):
-        """Send POS order webhook to Prepit API"""
+        """Send POS order webhooks to Prepit API"""
         try:
-            get_param = self.env['ir.config_parameter'].sudo().get_param
-            api_token = get_param('api_integration.token', '')
+            settings = self.env['ir.config_parameter']._get_prepit_settings()
+            timeout = settings.timeout('webhook')
+            batch_size = settings.get_int('prepithelp.webhook_batch_size', 1)
             
-            for order in self.sudo():
-                payload = self._prepare_pos_order_payload(order)
-                url = get_param('api_integration.url', 'https://api-pos.dev.prepit.app/')
-                
-                headers = {
-                    "X-Gateway-Token": api_token,
-                    "Content-Type": "application/json"
-                }
-                
-                response = requests.post(url, json=payload, headers=headers, timeout=10)
-                _logger.info("POS order %s -> Status: %s", order.name, response.status_code)
+            for orders, payload in self.sudo()._prepit_webhook_batches(batch_size):
+                calls = []
+                try:
+                    response = get_client().post(settings.url, payload, headers=settings.webhook_headers,
+                                                 timeout=timeout, on_call=calls.append, endpoint='webhook')
+                finally:
+                    self.env['prepit.sync.run']._record_calls('webhook', calls, len(orders))
+                _logger.info("POS orders %s -> Status: %s", ', '.join(orders.mapped('name')), response.status_code)
         except Exception as e:
             _logger.error("POS order webhook failed: %s", str(e))
     
-    def _prepare_pos_order_payload(self, order):
+    def _prepit_webhook_batches(self, batch_size, stock_levels=None):
+        """Yield (orders, payload) webhooks: one per order, or envelopes of batch_size orders"""
+        payloads = self._prepare_pos_order_payloads(stock_levels)
+        if batch_size <= 1:
+            for order in self:
+                yield order, payloads[order.id]
+            return
+        for ids in split_every(batch_size, self.ids):
+            yield self.browse(ids), {
+                "event": "pos_orders_paid",
+                "orders": [payloads[order_id] for order_id in ids],
+            }
+    
+    def _prepare_pos_order_payload(self, order, stock_levels=None):
         """Prepare POS order payload for Prepit webhook"""
-        lines_payload = []
-        for line in order.lines:
-            if line.product_id.exists():
-                lines_payload.append({
-                    "product_id": line.product_id.id,
-                    "product_name": line.product_id.display_name,
-                    "qty": line.qty,
-                    "price": line.price_unit,
-                })
+        return order._prepare_pos_order_payloads(stock_levels)[order.id]
+    
+    def _prepare_pos_order_payloads(self, stock_levels=None):
+        """Webhook payload per order id, built in a fixed number of queries for the whole recordset"""
+        orders = self.sudo()
+        order_rows = orders.read(['name', 'amount_total'], load=None)
+        line_rows = orders.lines.read(['order_id', 'product_id', 'qty', 'price_unit'], load=None)
         
-        return {
-            "event": "pos_order_paid",
-            "order_ref": order.name,
-            "amount_total": order.amount_total,
-            "lines": lines_payload,
+        # Lines of deleted products are skipped; names come from one prefetched batch
+        products = self.env['product.product'].sudo().browse(
+            list({row['product_id'] for row in line_rows if row['product_id']})
+        ).exists()
+        product_names = {product.id: product.display_name for product in products}
+        if stock_levels is None:
+            stock_levels = self.env['stock.quant']._prepit_on_hand(products)
+        
+        payloads = {
+            row['id']: {
+                "event": "pos_order_paid",
+                "order_ref": row['name'],
+                "amount_total": row['amount_total'],
+                "lines": [],
+            }
+            for row in order_rows
         }
+        for row in line_rows:
+            product_id = row['product_id']
+            if product_id not in product_names:
+                continue
+            payloads[row['order_id']]["lines"].append({
+                "product_id": product_id,
+                "product_name": product_names[product_id],
+                "qty": row['qty'],
+                "price": row['price_unit'],
+                "qty_on_hand": stock_levels.get(product_id, 0.0),
+            })
+        return payloads
+    
+    def _enqueue_prepit_webhook(self):
+        """Queue paid webhooks in the outbox; the dispatcher cron sends them after commit"""
+        Outbox = self.env['prepit.outbox'].sudo()
+        Outbox.create([{'order_id': order.id} for order in self])
+        Outbox._trigger_dispatch()
     
+    @profiled()
     def action_pos_order_paid(self):
         result = super(PosOrder, self).action_pos_order_paid()
-        self._post_prepit_webhook_with_stock()
+        self._enqueue_prepit_webhook()
         return result
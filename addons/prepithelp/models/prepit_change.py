@@ -0,0 +1,199 @@
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+from odoo.tools import SQL
+
+from ..tools.profiling import profiled
+
+_logger = logging.getLogger(__name__)
+
+# Fields whose change must reach Prepit; writes touching nothing else are ignored
+CAPTURED_FIELDS = {
+    'product.template': {
+        'name', 'list_price', 'taxes_id', 'pos_categ_ids', 'pos_branch_config_ids',
+        'available_in_pos', 'active', 'image_1920',
+    },
+    'pos.category': {'name', 'sequence', 'parent_id'},
+    'pos.config': {'name', 'prepit_name_ar', 'active', 'company_id'},
+}
+
+class PrepitChange(models.Model):
+    _name = "prepit.change"
+    _description = "Prepit Pending Change"
+    _order = "changed_at, id"
+
+    res_model = fields.Char(required=True, readonly=True)
+    res_id = fields.Integer(required=True, readonly=True)
+    operation = fields.Selection([
+        ('upsert', 'Create/Update'),
+        ('delete', 'Delete'),
+    ], required=True, readonly=True)
+    branch_ref = fields.Char(readonly=True, help="Prepit branch id of a deleted POS configuration")
+    first_changed_at = fields.Datetime(required=True, readonly=True)
+    changed_at = fields.Datetime(required=True, readonly=True, index=True)
+    change_count = fields.Integer(readonly=True, default=1)
+    claimed_at = fields.Datetime(readonly=True)
+    attempts = fields.Integer(readonly=True, help="Failed sends since the last edit of the record")
+    next_attempt_at = fields.Datetime(readonly=True)
+
+    _res_uniq = models.Constraint('UNIQUE(res_model, res_id)', "A record can only be queued once.")
+
+    # ----------------------
+    # CAPTURE
+    # ----------------------
+    @api.model
+    def _capture(self, records, operation='upsert', branch_refs=None, vals=None):
+        """Mark records dirty, merging repeated edits of a record into one row"""
+        if not records or self.env.context.get('prepit_no_capture'):
+            return
+        if vals is not None and not CAPTURED_FIELDS[records._name].intersection(vals):
+            return
+        branch_refs = branch_refs or {}
+        now = fields.Datetime.now()
+        rows = SQL(", ").join(
+            SQL("(%s, %s, %s, %s, %s, %s, 1, 0, %s, %s, %s, %s)",
+                records._name, record_id, operation, branch_refs.get(record_id), now, now,
+                self.env.uid, now, self.env.uid, now)
+            # A row may only be upserted once per statement
+            for record_id in dict.fromkeys(records.ids)
+        )
+        self.env.cr.execute(SQL("""
+            INSERT INTO prepit_change (res_model, res_id, operation, branch_ref, first_changed_at,
+                                       changed_at, change_count, attempts, create_uid, create_date,
+                                       write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (res_model, res_id) DO UPDATE
+               SET operation = EXCLUDED.operation,
+                   branch_ref = COALESCE(EXCLUDED.branch_ref, prepit_change.branch_ref),
+                   changed_at = EXCLUDED.changed_at,
+                   change_count = prepit_change.change_count + 1,
+                   attempts = 0,
+                   next_attempt_at = NULL,
+                   write_date = EXCLUDED.write_date
+        """, rows))
+        self.invalidate_model()
+
+    # ----------------------
+    # CRON METHODS
+    # ----------------------
+    @api.model
+    @profiled()
+    def _cron_flush(self, batch_size=500):
+        """Send changes that have been quiet for the debounce window"""
+        settings = self.env['ir.config_parameter']._get_prepit_settings()
+        now = fields.Datetime.now()
+        quiet_since = now - timedelta(seconds=settings.get_int('prepithelp.change_debounce_seconds', 60))
+        # Records edited non-stop are still flushed once their first change is this old
+        oldest = now - timedelta(seconds=settings.get_int('prepithelp.change_max_delay_seconds', 600))
+        stale_claim = now - timedelta(minutes=15)
+        max_attempts = settings.get_int('prepithelp.change_max_attempts', 10)
+
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM prepit_change
+             WHERE (changed_at <= %s OR first_changed_at <= %s)
+               AND (claimed_at IS NULL OR claimed_at < %s)
+               AND (next_attempt_at IS NULL OR next_attempt_at <= %s)
+               AND attempts < %s
+          ORDER BY changed_at
+             LIMIT %s
+        FOR UPDATE SKIP LOCKED
+        """, [quiet_since, oldest, stale_claim, now, max_attempts, batch_size])
+        changes = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if not changes:
+            return True
+
+        # Claim and commit so that edits made during the HTTP calls never wait on these rows
+        changes.write({'claimed_at': now})
+        snapshot = {change.id: change.change_count for change in changes}
+        self.env.cr.commit()
+
+        # The pull snapshot only depends on our own data, refresh it whatever Prepit answers
+        self.env['prepit.menu.fragment']._refresh_changes(changes)
+        self.env.cr.commit()
+
+        done = changes._flush()
+
+        # Rows edited again while flushing keep their newer change and are sent next time;
+        # every capture bumps change_count, unlike changed_at which can repeat within a second
+        if done:
+            self.env.cr.execute(SQL(
+                """DELETE FROM prepit_change AS c USING (VALUES %s) AS v(id, change_count)
+                    WHERE c.id = v.id AND c.change_count = v.change_count""",
+                SQL(", ").join(SQL("(%s, %s)", change.id, snapshot[change.id]) for change in done),
+            ))
+        self.env.cr.execute("UPDATE prepit_change SET claimed_at = NULL WHERE id = ANY(%s)", [done.ids])
+        # Failed changes back off 1, 2, 4 ... minutes, capped at one hour, until max_attempts;
+        # a new edit of the record gives its change a fresh set of attempts
+        failed = changes - done
+        self.env.cr.execute("""
+            UPDATE prepit_change
+               SET claimed_at = NULL,
+                   attempts = attempts + 1,
+                   next_attempt_at = %s::timestamp + LEAST(60, power(2, attempts)) * interval '1 minute'
+             WHERE id = ANY(%s)
+         RETURNING res_model, res_id, attempts
+        """, [now, failed.ids])
+        for res_model, res_id, attempts in self.env.cr.fetchall():
+            if attempts >= max_attempts:
+                _logger.error("Prepit change of %s %s given up after %d attempts, a full sync will resend it",
+                              res_model, res_id, attempts)
+        self.invalidate_model()
+        _logger.info("Prepit change flush: %d of %d queued changes sent", len(done), len(changes))
+        return True
+
+    # ----------------------
+    # PRIVATE METHODS
+    # ----------------------
+    def _flush(self):
+        """Send the given changes grouped by model and operation; return the ones delivered"""
+        Helper = self.env['prepithelp.prepithelp']
+        done = self.browse()
+
+        def select(model, operation):
+            return self.filtered(lambda c: c.res_model == model and c.operation == operation)
+
+        # Products: one batched sync for the live ones, an unavailable entry for the rest
+        products = select('product.template', 'upsert') | select('product.template', 'delete')
+        if products:
+            templates = self.env['product.template'].sudo().with_context(active_test=False).browse(
+                products.mapped('res_id')).exists()
+            live = templates.filtered(lambda t: t.active and t.available_in_pos)
+            removed_ids = set(products.mapped('res_id')) - set(live.ids)
+            ok = True
+            if live:
+                ok = Helper.sync_prepit_products_safe(template_ids=live.ids)
+            if removed_ids:
+                ok = Helper._send_product_removals(sorted(removed_ids)) and ok
+            if ok:
+                done |= products
+
+        # Categories: the delta sync resends exactly what changed and keeps its own state
+        categories = select('pos.category', 'upsert')
+        if categories and Helper._sync_categories():
+            done |= categories
+        # Category deletes are not pushed; they only matter to the menu snapshot
+        done |= select('pos.category', 'delete')
+
+        # Branches: concurrent updates and deletes, per-branch outcome
+        branch_updates = select('pos.config', 'upsert')
+        if branch_updates:
+            configs = self.env['pos.config'].sudo().browse(branch_updates.mapped('res_id')).exists()
+            report = Helper.update_branches(configs)
+            ok_refs = {result['branch'] for result in report['branches'] if result['ok']}
+            config_by_id = {config.id: config for config in configs}
+            for change in branch_updates:
+                config = config_by_id.get(change.res_id)
+                # Configurations deleted since the change was queued need no update
+                if not config or Helper._generate_branch_id(config) in ok_refs:
+                    done |= change
+
+        branch_deletes = select('pos.config', 'delete').filtered('branch_ref')
+        if branch_deletes:
+            report = Helper._delete_branch_ids(branch_deletes.mapped('branch_ref'))
+            ok_refs = {result['branch'] for result in report['branches'] if result['ok']}
+            done |= branch_deletes.filtered(lambda c: c.branch_ref in ok_refs)
+        done |= select('pos.config', 'delete').filtered(lambda c: not c.branch_ref)
+
+        return done
@@ -0,0 +1,195 @@
+from odoo import models, fields, api
+from odoo.tools import SQL, split_every
+from psycopg2.extras import Json
+import gzip
+import hashlib
+import logging
+import uuid
+
+from ..tools.prepit_json import dumps
+
+_logger = logging.getLogger(__name__)
+
+# kind -> source model of the fragment
+FRAGMENT_MODELS = {
+    'category': 'pos.category',
+    'product': 'product.template',
+    'branch': 'pos.config',
+}
+
+# Encoded menu bodies kept per worker: (database, etag) -> gzip bytes
+_BODY_CACHE = {}
+_BODY_CACHE_SIZE = 32
+
+# prepit.sync.state row holding the version of the menu snapshot
+MENU_STATE = 'menu'
+
+class PrepitMenuFragment(models.Model):
+    _name = "prepit.menu.fragment"
+    _description = "Prepit Menu Snapshot Fragment"
+    _order = "kind, res_id"
+
+    kind = fields.Selection([
+        ('category', 'Category'),
+        ('product', 'Product'),
+        ('branch', 'Branch'),
+    ], required=True, readonly=True)
+    res_id = fields.Integer(required=True, readonly=True)
+    digest = fields.Char(readonly=True)
+    data = fields.Json(readonly=True)
+
+    _res_uniq = models.Constraint('UNIQUE(kind, res_id)', "A record has a single menu fragment.")
+
+    # ----------------------
+    # REFRESH
+    # ----------------------
+    @api.model
+    def _rebuild(self):
+        """Regenerate every fragment and drop the ones whose record is gone"""
+        changed = False
+        for kind, model in FRAGMENT_MODELS.items():
+            ids = self.env[model].sudo().with_context(active_test=False).search([]).ids
+            changed = self._refresh(kind, ids, bump_version=False) or changed
+            self.env.cr.execute(
+                "DELETE FROM prepit_menu_fragment WHERE kind = %s AND NOT (res_id = ANY(%s))",
+                [kind, ids],
+            )
+            changed = changed or bool(self.env.cr.rowcount)
+        self.invalidate_model()
+        if changed:
+            self._bump_version()
+        return True
+
+    @api.model
+    def _refresh_changes(self, changes):
+        """Regenerate the fragments of the records behind queued prepit.change rows"""
+        for kind, model in FRAGMENT_MODELS.items():
+            ids = [change.res_id for change in changes if change.res_model == model]
+            if ids:
+                self._refresh(kind, ids)
+
+    @api.model
+    def _refresh(self, kind, ids, bump_version=True):
+        """Rebuild the fragments of the given records; records gone from the menu lose theirs.
+
+        Returns whether any fragment changed, in which case the snapshot
+        gets a new version unless ``bump_version`` is False.
+        """
+        Helper = self.env['prepithelp.prepithelp']
+        records = self.env[FRAGMENT_MODELS[kind]].sudo().with_context(active_test=False).browse(ids).exists()
+        if kind == 'product':
+            live = records.filtered(lambda t: t.active and t.available_in_pos)
+            items = zip(live.ids, Helper._prepare_products_data(live))
+        elif kind == 'category':
+            # Product lists are joined at serve time, so a product move only touches its own fragment
+            live = records
+            names = Helper._get_names(live)
+            items = (
+                (category.id, {
+                    "posCategoryId": f"category-{category.id:03d}",
+                    "name": names[category.id],
+                    "order": category.sequence or 0,
+                })
+                for category in live
+            )
+        else:
+            live = records.filtered('active')
+            Helper._get_names(live)
+            items = ((config.id, Helper._prepare_single_branch_data(config)) for config in live)
+
+        changed = 0
+        rows = []
+        now = fields.Datetime.now()
+        for res_id, data in items:
+            rows.append(SQL("(%s, %s, %s, %s, %s, %s, %s, %s)", kind, res_id, Helper._hash_payload(data),
+                            Json(data), self.env.uid, now, self.env.uid, now))
+        for batch in split_every(1000, rows):
+            # Unchanged fragments are left untouched
+            self.env.cr.execute(SQL("""
+                INSERT INTO prepit_menu_fragment (kind, res_id, digest, data, create_uid, create_date,
+                                                  write_uid, write_date)
+                VALUES %s
+                ON CONFLICT (kind, res_id) DO UPDATE
+                   SET digest = EXCLUDED.digest,
+                       data = EXCLUDED.data,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                 WHERE prepit_menu_fragment.digest IS DISTINCT FROM EXCLUDED.digest
+            """, SQL(", ").join(batch)))
+            changed += self.env.cr.rowcount
+        gone = set(ids) - set(live.ids)
+        if gone:
+            self.env.cr.execute(
+                "DELETE FROM prepit_menu_fragment WHERE kind = %s AND res_id = ANY(%s)",
+                [kind, list(gone)],
+            )
+            changed += self.env.cr.rowcount
+        self.invalidate_model()
+        if changed and bump_version:
+            self._bump_version()
+        return bool(changed)
+
+    @api.model
+    def _bump_version(self):
+        """Give the snapshot a new version, telling pollers their copy is outdated"""
+        self.env['prepit.sync.state']._get_state(MENU_STATE).version = uuid.uuid4().hex
+
+    # ----------------------
+    # SERVING
+    # ----------------------
+    @api.model
+    def _get_etag(self, branch_id=None):
+        """Version tag of the snapshot, read from the single row bumped by every refresh"""
+        # A random version, unlike timestamps, cannot repeat within a second or go back in time
+        self.env['prepit.sync.state'].flush_model(['version'])
+        self.env.cr.execute("SELECT version FROM prepit_sync_state WHERE name = %s", [MENU_STATE])
+        row = self.env.cr.fetchone()
+        content = row and row[0]
+        chain_id = self.env['ir.config_parameter']._get_prepit_settings().chain_id
+        version = f"{content}-{chain_id}-{branch_id or ''}"
+        return hashlib.sha1(version.encode()).hexdigest()[:20]
+
+    @api.model
+    def _get_menu_body(self, etag, branch_id=None):
+        """Gzip-encoded menu for an ETag, encoded once per worker"""
+        key = (self.env.cr.dbname, etag)
+        body = _BODY_CACHE.get(key)
+        if body is None:
+            menu = self._build_menu(branch_id)
+            menu["version"] = etag
+            body = gzip.compress(dumps(menu), compresslevel=6)
+            if len(_BODY_CACHE) >= _BODY_CACHE_SIZE:
+                _BODY_CACHE.clear()
+            _BODY_CACHE[key] = body
+        return body
+
+    @api.model
+    def _build_menu(self, branch_id=None):
+        """Assemble the menu from the stored fragments, optionally for a single branch"""
+        self.flush_model()
+        self.env.cr.execute("SELECT kind, data FROM prepit_menu_fragment ORDER BY kind, res_id")
+        fragments = {'category': [], 'product': [], 'branch': []}
+        for kind, data in self.env.cr.fetchall():
+            fragments[kind].append(data)
+
+        products = fragments['product']
+        branches = fragments['branch']
+        if branch_id:
+            # An empty branch list means the product is sold in every branch
+            products = [p for p in products if not p['branches'] or branch_id in p['branches']]
+            branches = [b for b in branches if b['posBranchId'] == branch_id]
+
+        products_by_category = {}
+        for product in products:
+            for category_id in product['posCategoryIds']:
+                products_by_category.setdefault(category_id, []).append(product['posProductId'])
+        categories = [
+            dict(category, products=products_by_category.get(category['posCategoryId'], []))
+            for category in sorted(fragments['category'], key=lambda c: c['order'])
+        ]
+        return {
+            "posChainId": self.env['ir.config_parameter']._get_prepit_settings().chain_id,
+            "categories": categories,
+            "products": products,
+            "branches": branches,
+        }
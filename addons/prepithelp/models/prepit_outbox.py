@@ -0,0 +1,297 @@
+from odoo import models, fields, api
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+from ..tools.prepit_client import CircuitOpenError, get_client, run_concurrently
+from ..tools.profiling import profiled
+
+_logger = logging.getLogger(__name__)
+
+STOCK_URL = "https://api-pos.dev.prepit.app/menu/update-stock"
+
+class PrepitOutbox(models.Model):
+    _name = "prepit.outbox"
+    _description = "Prepit Webhook Outbox"
+    _order = "id"
+
+    event = fields.Selection([
+        ('pos_order_paid', 'POS Order Paid'),
+        ('stock_level', 'Stock Level Change'),
+        ('deferred', 'Deferred Call'),
+    ], required=True, default='pos_order_paid')
+    order_id = fields.Many2one('pos.order', ondelete='cascade', index=True)
+    product_tmpl_id = fields.Many2one('product.template', ondelete='cascade', index=True)
+    # Deferred calls keep the records they were about and rebuild their payload when
+    # dispatched, so a late replay never overwrites newer data on Prepit
+    url = fields.Char(readonly=True)
+    endpoint = fields.Char(readonly=True)
+    res_model = fields.Char(readonly=True)
+    res_ids = fields.Json(readonly=True)
+    chain_id = fields.Char(readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Sent'),
+        ('dead', 'Dead Letter'),
+    ], required=True, default='pending', index=True)
+    attempts = fields.Integer(readonly=True)
+    next_attempt_at = fields.Datetime(default=fields.Datetime.now, readonly=True)
+    sent_at = fields.Datetime(readonly=True)
+    last_error = fields.Text(readonly=True)
+
+    _pending_idx = models.Index("(next_attempt_at, id) WHERE state = 'pending'")
+
+    # ----------------------
+    # ACTION METHODS
+    # ----------------------
+    def action_retry(self):
+        self.write({
+            'state': 'pending',
+            'attempts': 0,
+            'next_attempt_at': fields.Datetime.now(),
+            'last_error': False,
+        })
+        self._trigger_dispatch()
+        return True
+
+    # ----------------------
+    # CRON METHODS
+    # ----------------------
+    @api.model
+    @profiled()
+    def _cron_dispatch(self, max_batches=20):
+        """Drain pending outbox entries in batches, committing after each batch"""
+        batch_size = self._get_outbox_param('batch_size', 50)
+        for _ in range(max_batches):
+            entries = self._claim_batch(batch_size)
+            if not entries:
+                break
+            entries._dispatch()
+            # Release the row locks so other workers can claim the next batch
+            self.env.cr.commit()
+        return True
+
+    @api.autovacuum
+    def _gc_sent_entries(self):
+        """Remove delivered entries after a week"""
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.search([('state', '=', 'done'), ('sent_at', '<', limit_date)]).unlink()
+
+    # ----------------------
+    # PRIVATE METHODS
+    # ----------------------
+    @api.model
+    def _get_outbox_param(self, key, default):
+        settings = self.env['ir.config_parameter']._get_prepit_settings()
+        return settings.get_int(f'prepithelp.outbox_{key}', default)
+
+    @api.model
+    def _trigger_dispatch(self):
+        cron = self.env.ref('prepithelp.ir_cron_prepit_outbox_dispatch', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _enqueue_stock_changes(self, templates):
+        """Queue a stock check per template.
+
+        Not deduplicated here: a pending entry may already be claimed by a
+        dispatcher reading the old quantity. Checks of the same template are
+        merged when a batch is dispatched.
+        """
+        self.sudo().create([{'event': 'stock_level', 'product_tmpl_id': template.id} for template in templates])
+        self._trigger_dispatch()
+
+    @api.model
+    def _enqueue_deferred(self, url, records, endpoint, chain_id, error):
+        """Queue a call that could not reach Prepit, to be rebuilt and sent by the dispatcher"""
+        # Like stock checks, identical calls are merged at dispatch time, never skipped here
+        self.sudo().create({
+            'event': 'deferred',
+            'url': url,
+            'endpoint': endpoint,
+            'res_model': records._name,
+            'res_ids': records.ids,
+            'chain_id': chain_id,
+            'last_error': error,
+        })
+        self._trigger_dispatch()
+
+    @api.model
+    def _claim_batch(self, batch_size):
+        """Lock a batch of due entries, skipping rows held by other workers"""
+        self.env['prepit.outbox'].flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM prepit_outbox
+             WHERE state = 'pending' AND next_attempt_at <= %s
+          ORDER BY id
+             LIMIT %s
+        FOR UPDATE SKIP LOCKED
+        """, [fields.Datetime.now(), batch_size])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _dispatch(self):
+        """Send a claimed batch concurrently and record the outcome of each entry"""
+        settings = self.env['ir.config_parameter']._get_prepit_settings()
+        timeout = settings.timeout('webhook')
+        concurrency = max(1, self._get_outbox_param('concurrency', 4))
+        client = get_client()
+
+        # Payloads are built here, HTTP calls never touch the ORM
+        order_entries = self.filtered(lambda entry: entry.event == 'pos_order_paid')
+        stock_entries = self.filtered(lambda entry: entry.event == 'stock_level')
+        jobs = order_entries._prepare_order_jobs(settings)
+        jobs += stock_entries._prepare_stock_jobs(settings)
+        jobs += (self - order_entries - stock_entries)._prepare_deferred_jobs(settings)
+
+        def post(job):
+            try:
+                response = client.post(job['url'], job['payload'], headers=job['headers'],
+                                       timeout=job.get('timeout') or timeout,
+                                       on_call=job['calls'].append, endpoint=job['endpoint'])
+                if 200 <= response.status_code < 300:
+                    return None
+                return f"HTTP {response.status_code}: {response.text[:200]}"
+            except CircuitOpenError as e:
+                job['retry_in'] = e.retry_in
+                return str(e)
+            except Exception as e:
+                return str(e)
+
+        to_send = [job for job in jobs if job['payload'] is not None]
+        errors = run_concurrently(post, to_send, concurrency)
+        for job, error in zip(to_send, errors):
+            job['error'] = error
+            self.env['prepit.sync.run']._record_calls(job['endpoint'], job['calls'], job['record_count'])
+
+        now = fields.Datetime.now()
+        for job in jobs:
+            error = job.get('error')
+            for entry in job['entries']:
+                if 'retry_in' in job:
+                    entry._postpone(job['retry_in'], error)
+                elif error:
+                    entry._record_failure(error)
+                else:
+                    entry.write({'state': 'done', 'sent_at': now, 'attempts': entry.attempts + 1, 'last_error': False})
+            if not error and job.get('stock_states'):
+                self.env['product.template']._prepit_store_stock_states(job['stock_states'])
+        _logger.info("Prepit outbox dispatched %d entries (%d failed)",
+                     len(self), len([job for job in to_send if job['error']]))
+
+    def _make_job(self, url, headers, payload, endpoint, record_count):
+        return {
+            'entries': self,
+            'url': url,
+            'headers': headers,
+            'payload': payload,
+            'endpoint': endpoint,
+            'record_count': record_count,
+            'calls': [],
+        }
+
+    def _prepare_order_jobs(self, settings):
+        """Order webhooks for the whole batch, built in one pass and grouped per webhook_batch_size"""
+        if not self:
+            return []
+        batch_size = settings.get_int('prepithelp.webhook_batch_size', 1)
+        try:
+            batches = list(self.order_id._prepit_webhook_batches(batch_size))
+        except Exception as e:
+            if len(self) == 1:
+                self._record_failure(f"Payload preparation failed: {e}")
+                return []
+            # Isolate the order that cannot be serialised instead of failing its neighbours
+            jobs = []
+            for entry in self:
+                jobs += entry._prepare_order_jobs(settings)
+            return jobs
+        entries_by_order = defaultdict(lambda: self.browse())
+        for entry in self:
+            entries_by_order[entry.order_id.id] |= entry
+        jobs = []
+        for orders, payload in batches:
+            entries = self.browse()
+            for order in orders:
+                entries |= entries_by_order[order.id]
+            jobs.append(entries._make_job(settings.url, settings.webhook_headers, payload, 'webhook', len(orders)))
+        return jobs
+
+    def _prepare_stock_jobs(self, settings):
+        """Coalesce stock checks into one push holding only templates whose stock state changed"""
+        if not self:
+            return []
+        templates = self.product_tmpl_id
+        levels = self.env['stock.quant']._prepit_template_on_hand(templates)
+        threshold = settings.get_float('prepithelp.low_stock_threshold', 0.0)
+
+        stock_states = {}
+        products = []
+        for template in templates:
+            qty = levels.get(template.id, 0.0)
+            state = 'out' if qty <= 0 else 'low' if qty <= threshold else 'ok'
+            if state == (template.prepit_stock_state or 'ok'):
+                continue
+            stock_states[template.id] = state
+            products.append({
+                "posProductId": f"product-{template.id}",
+                "qtyOnHand": qty,
+                "stockState": state,
+                "available": state != 'out',
+            })
+
+        if not products:
+            # Nothing crossed a threshold: the entries are settled without a call
+            return [self._make_job(None, None, None, 'stock_push', 0)]
+        payload = {"posChainId": settings.chain_id, "products": products}
+        job = self._make_job(STOCK_URL, settings.json_headers, payload, 'stock_push', len(products))
+        job['stock_states'] = stock_states
+        return [job]
+
+    def _prepare_deferred_jobs(self, settings):
+        """Rebuild deferred calls from the current state of their records, with the endpoint's own timeout"""
+        SyncRun = self.env['prepit.sync.run']
+        # Entries deferred for the same call are sent once
+        groups = defaultdict(lambda: self.browse())
+        for entry in self:
+            key = (entry.url, entry.endpoint, entry.chain_id, entry.res_model, tuple(sorted(entry.res_ids or [])))
+            groups[key] |= entry
+        jobs = []
+        for (url, endpoint, chain_id, res_model, res_ids), entries in groups.items():
+            records = self.env[res_model].sudo().with_context(active_test=False).browse(res_ids).exists()
+            Helper = self.env['prepithelp.prepithelp'].with_context(prepit_chain_id=chain_id)
+            try:
+                payload = Helper._prepare_deferred_payload(endpoint, records)
+            except Exception as e:
+                for entry in entries:
+                    entry._record_failure(f"Payload preparation failed: {e}")
+                continue
+            # Records deleted or de-listed since leave nothing to send
+            record_count = SyncRun._count_records(payload) if payload is not None else 0
+            job = entries._make_job(url, settings.json_headers, payload, endpoint, record_count)
+            job['timeout'] = settings.timeout(endpoint)
+            jobs.append(job)
+        return jobs
+
+    def _postpone(self, retry_in, error):
+        """Wait for the circuit to reopen; a call that was never attempted costs no attempt"""
+        self.write({
+            'last_error': error,
+            'next_attempt_at': fields.Datetime.now() + timedelta(seconds=max(retry_in, 1)),
+        })
+
+    def _record_failure(self, error):
+        self.ensure_one()
+        attempts = self.attempts + 1
+        max_attempts = self._get_outbox_param('max_attempts', 8)
+        if attempts >= max_attempts:
+            _logger.error("Prepit outbox entry %s dead-lettered after %d attempts: %s", self.id, attempts, error)
+            self.write({'state': 'dead', 'attempts': attempts, 'last_error': error})
+            return
+        # Exponential backoff: 1, 2, 4 ... minutes, capped at one hour
+        delay = min(60, 2 ** (attempts - 1))
+        self.write({
+            'attempts': attempts,
+            'last_error': error,
+            'next_attempt_at': fields.Datetime.now() + timedelta(minutes=delay),
+        })
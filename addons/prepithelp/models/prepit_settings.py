@@ -0,0 +1,85 @@
+from odoo import models
+from odoo.tools import ormcache
+from types import MappingProxyType
+import logging
+
+from ..tools.prepit_client import DEFAULT_TIMEOUTS
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_API_URL = 'https://api-pos.dev.prepit.app/'
+DEFAULT_CHAIN_ID = '019c229b-9df2-77c5-99e5-b7fc1165e530'
+
+class PrepitSettings:
+    """Read-only snapshot of the api_integration.* and prepithelp.* parameters"""
+
+    __slots__ = (
+        '_params', 'token', 'url', 'api_url', 'chain_id',
+        'json_headers', 'accept_headers', 'webhook_headers', 'problems',
+    )
+
+    def __init__(self, params):
+        self._params = MappingProxyType(dict(params))
+        self.token = params.get('api_integration.token') or ''
+        self.url = params.get('api_integration.url') or DEFAULT_API_URL
+        self.api_url = self.url.rstrip('/')
+        self.chain_id = params.get('api_integration.chain_id') or DEFAULT_CHAIN_ID
+        self.json_headers = MappingProxyType({
+            "X-Gateway-Token": self.token,
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        })
+        self.accept_headers = MappingProxyType({
+            "X-Gateway-Token": self.token,
+            "Accept": "application/json",
+        })
+        self.webhook_headers = MappingProxyType({
+            "X-Gateway-Token": self.token,
+            "Content-Type": "application/json",
+        })
+        self.problems = tuple(self._validate())
+
+    def _validate(self):
+        if not self.token:
+            yield "api_integration.token is not set"
+        if not self.url.startswith(('http://', 'https://')):
+            yield f"api_integration.url is not an HTTP URL: {self.url}"
+        if not self.chain_id.strip():
+            yield "api_integration.chain_id is empty"
+
+    def get(self, key, default=None):
+        return self._params.get(key) or default
+
+    def get_int(self, key, default=0):
+        try:
+            return int(self._params.get(key) or default)
+        except ValueError:
+            return default
+
+    def get_float(self, key, default=0.0):
+        try:
+            return float(self._params.get(key) or default)
+        except ValueError:
+            return default
+
+    def timeout(self, endpoint):
+        default = DEFAULT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUTS['default'])
+        return self.get_float(f'prepithelp.timeout_{endpoint}', default)
+
+
+class IrConfigParameter(models.Model):
+    _inherit = "ir.config_parameter"
+
+    # create/write/unlink on ir.config_parameter clear the registry caches,
+    # which drops this snapshot whenever any parameter changes
+    @ormcache()
+    def _get_prepit_settings(self):
+        """Load every integration parameter in one query and cache it per registry"""
+        params = self.sudo().search_read(
+            ['|', ('key', '=like', 'api_integration.%'), ('key', '=like', 'prepithelp.%')],
+            ['key', 'value'],
+        )
+        settings = PrepitSettings({param['key']: param['value'] for param in params})
+        for problem in settings.problems:
+            _logger.warning("Prepit settings: %s", problem)
+        return settings
@@ -0,0 +1,192 @@
+from odoo import models, fields, api, Command
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+from ..tools.profiling import profiled
+
+_logger = logging.getLogger(__name__)
+
+# kind -> helper method running a full sync of that kind for the current shard
+SYNC_JOB_METHODS = {
+    'categories': '_sync_categories',
+    'products': 'sync_prepit_products_safe',
+    'branches': '_sync_branches',
+}
+
+# First key of the session advisory locks held by the worker running a job
+SYNC_JOB_LOCK = 0x5052_4a42  # "PRJB"
+
+class PrepitSyncJob(models.Model):
+    _name = "prepit.sync.job"
+    _description = "Prepit Sync Job"
+    _order = "id desc"
+
+    chain_id = fields.Char(required=True, readonly=True)
+    company_ids = fields.Many2many('res.company', string="Companies", readonly=True,
+                                   help="Companies whose shops belong to the chain")
+    kind = fields.Selection([
+        ('categories', 'Categories'),
+        ('products', 'Products'),
+        ('branches', 'Branches'),
+    ], required=True, readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], required=True, default='pending', readonly=True, index=True)
+    attempts = fields.Integer(readonly=True)
+    started_at = fields.Datetime(readonly=True)
+    finished_at = fields.Datetime(readonly=True)
+    last_error = fields.Text(readonly=True)
+
+    _pending_idx = models.Index("(id) WHERE state IN ('pending', 'running')")
+
+    # ----------------------
+    # ACTION METHODS
+    # ----------------------
+    def action_retry(self):
+        self.write({'state': 'pending', 'attempts': 0, 'last_error': False})
+        self._trigger_workers()
+        return True
+
+    # ----------------------
+    # CRON METHODS
+    # ----------------------
+    @api.model
+    @profiled()
+    def _cron_run_jobs(self, max_jobs=20):
+        """Claim and run jobs one by one; every worker cron runs this concurrently"""
+        for _ in range(max_jobs):
+            job = self._claim_job()
+            if not job:
+                break
+            try:
+                job._run()
+            except Exception:
+                self.env.cr.rollback()
+                raise
+            finally:
+                # Session locks outlive the transaction and the pooled connection
+                job._release()
+        return True
+
+    @api.autovacuum
+    def _gc_finished_jobs(self):
+        """Remove finished jobs after a week"""
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.search([('state', 'in', ('done', 'failed')), ('finished_at', '<', limit_date)]).unlink()
+
+    # ----------------------
+    # PRIVATE METHODS
+    # ----------------------
+    @api.model
+    def _enqueue(self, kinds=None, chains=None):
+        """Queue one job per chain and kind, skipping shards that already have one waiting"""
+        kinds = kinds or list(SYNC_JOB_METHODS)
+        if chains is None:
+            chains = self._get_chain_companies()
+        queued = {
+            (job.chain_id, job.kind)
+            for job in self.sudo().search([('state', 'in', ('pending', 'running')), ('kind', 'in', kinds)])
+        }
+        vals_list = [
+            {
+                'chain_id': chain_id,
+                'company_ids': [Command.set(companies.ids)],
+                'kind': kind,
+            }
+            for chain_id, companies in chains.items()
+            for kind in kinds
+            if (chain_id, kind) not in queued
+        ]
+        jobs = self.sudo().create(vals_list)
+        if jobs:
+            self._trigger_workers()
+        return jobs
+
+    @api.model
+    def _get_companies(self):
+        """Companies running a PoS, the only ones with anything to sync"""
+        return self.env['pos.config'].sudo().with_context(active_test=False).search([]).company_id
+
+    @api.model
+    def _get_chain_companies(self):
+        """Companies running a PoS grouped by the Prepit chain of their shops"""
+        default_chain = self.env['ir.config_parameter']._get_prepit_settings().chain_id
+        chains = defaultdict(lambda: self.env['res.company'])
+        for company in self._get_companies():
+            chains[company.prepit_chain_id or default_chain] |= company
+        return dict(chains)
+
+    @api.model
+    def _trigger_workers(self):
+        # Each worker cron is locked by its own runner, so triggering all of them fans the queue out
+        for xmlid in ('prepithelp.ir_cron_prepit_sync_worker_1', 'prepithelp.ir_cron_prepit_sync_worker_2'):
+            cron = self.env.ref(xmlid, raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+
+    @api.model
+    def _claim_job(self, candidates=50):
+        """Lock one due job, skipping jobs held by other workers, and commit the claim.
+
+        The worker keeps a session advisory lock on the job until it is run,
+        so a running job whose lock is free lost its worker and is taken over,
+        until it has used up its attempts.
+        """
+        max_attempts = self.env['ir.config_parameter']._get_prepit_settings().get_int(
+            'prepithelp.sync_job_max_attempts', 3)
+        self.env['prepit.sync.job'].flush_model()
+        self.env.cr.execute("""
+            SELECT id FROM prepit_sync_job
+             WHERE state IN ('pending', 'running')
+          ORDER BY id
+             LIMIT %s
+        FOR UPDATE SKIP LOCKED
+        """, [candidates])
+        for job in self.browse([row[0] for row in self.env.cr.fetchall()]):
+            self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", [SYNC_JOB_LOCK, job.id])
+            if not self.env.cr.fetchone()[0]:
+                continue
+            if job.attempts >= max_attempts:
+                _logger.error("Prepit %s sync job %s given up after %d attempts", job.kind, job.id, job.attempts)
+                job.write({
+                    'state': 'failed',
+                    'finished_at': fields.Datetime.now(),
+                    'last_error': "Worker lost %d times, giving up" % job.attempts,
+                })
+                job._release()
+                continue
+            job.write({'state': 'running', 'started_at': fields.Datetime.now(), 'attempts': job.attempts + 1})
+            # A running job is owned by its worker; long syncs must not hold the row lock
+            self.env.cr.commit()
+            return job
+        self.env.cr.commit()
+        return self.browse()
+
+    def _release(self):
+        self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", [SYNC_JOB_LOCK, self.id])
+
+    def _run(self):
+        self.ensure_one()
+        Helper = self.env['prepithelp.prepithelp'].with_company(self.company_ids[:1]).with_context(
+            prepit_chain_id=self.chain_id,
+            prepit_company_ids=self.company_ids.ids,
+            prepit_commit_pages=True,
+        )
+        error = False
+        try:
+            if not getattr(Helper, SYNC_JOB_METHODS[self.kind])():
+                error = "Sync reported a failure, see the sync runs for details"
+        except Exception as e:
+            self.env.cr.rollback()
+            error = str(e)
+            _logger.error("Prepit %s sync job %s failed: %s", self.kind, self.id, error)
+        self.write({
+            'state': 'failed' if error else 'done',
+            'finished_at': fields.Datetime.now(),
+            'last_error': error,
+        })
+        self.env.cr.commit()
@@ -0,0 +1,130 @@
+from odoo import models, fields, api, tools
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class PrepitSyncRun(models.Model):
+    _name = "prepit.sync.run"
+    _description = "Prepit Outbound Call"
+    _order = "id desc"
+
+    endpoint = fields.Char(required=True, index=True, readonly=True)
+    method = fields.Char(readonly=True)
+    url = fields.Char(readonly=True)
+    status_code = fields.Integer(readonly=True, aggregator=False)
+    success = fields.Boolean(readonly=True)
+    duration_ms = fields.Float(string="Duration (ms)", readonly=True, aggregator='avg')
+    payload_bytes = fields.Integer(readonly=True)
+    response_bytes = fields.Integer(readonly=True)
+    record_count = fields.Integer(readonly=True)
+    retries = fields.Integer(readonly=True)
+    error = fields.Char(readonly=True)
+
+    @api.model
+    def _record_calls(self, endpoint, calls, record_count=0):
+        """Store the CallStats collected from the HTTP client as sync runs.
+
+        They are committed in their own transaction, so the calls of a sync
+        that fails and rolls back are kept for the operators.
+        """
+        if not calls:
+            return
+        vals_list = [{
+            'endpoint': endpoint,
+            'method': call.method,
+            'url': call.url[:255],
+            'status_code': call.status_code,
+            'success': 200 <= call.status_code < 300,
+            'duration_ms': call.duration * 1000.0,
+            'payload_bytes': call.request_bytes,
+            'response_bytes': call.response_bytes,
+            'record_count': record_count,
+            'retries': call.retries,
+            'error': call.error and call.error[:255],
+        } for call in calls]
+        with self.env.registry.cursor() as cr:
+            self.env(cr=cr, su=True)['prepit.sync.run'].create(vals_list)
+
+    @api.model
+    def _count_records(self, payload):
+        """Number of records carried by a payload: its list lengths, or 1"""
+        if not isinstance(payload, dict):
+            return len(payload) if isinstance(payload, list) else 1
+        sizes = [len(value) for value in payload.values() if isinstance(value, list)]
+        return sum(sizes) if sizes else 1
+
+    @api.model
+    def _get_latency_summary(self, hours=24):
+        """Per-endpoint call count, latency percentiles and throughput over the last hours"""
+        self.flush_model()
+        self.env.cr.execute("""
+            SELECT endpoint,
+                   count(*),
+                   count(*) FILTER (WHERE NOT success),
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms),
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms),
+                   percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms),
+                   sum(payload_bytes),
+                   sum(record_count),
+                   sum(duration_ms)
+              FROM prepit_sync_run
+             WHERE create_date >= %s
+          GROUP BY endpoint
+          ORDER BY endpoint
+        """, [fields.Datetime.now() - timedelta(hours=hours)])
+        return [{
+            'endpoint': endpoint,
+            'calls': calls,
+            'failed': failed,
+            'p50': p50,
+            'p95': p95,
+            'p99': p99,
+            'bytes': payload_bytes or 0,
+            'records': records or 0,
+            'records_per_second': (records or 0) / (total_ms / 1000.0) if total_ms else 0.0,
+        } for endpoint, calls, failed, p50, p95, p99, payload_bytes, records, total_ms in self.env.cr.fetchall()]
+
+    @api.autovacuum
+    def _gc_old_runs(self):
+        settings = self.env['ir.config_parameter']._get_prepit_settings()
+        days = settings.get_int('prepithelp.telemetry_retention_days', 30)
+        self.search([('create_date', '<', fields.Datetime.now() - timedelta(days=days))]).unlink()
+
+
+class PrepitSyncStats(models.Model):
+    _name = "prepit.sync.stats"
+    _description = "Prepit Hourly Call Statistics"
+    _auto = False
+    _order = "hour desc, endpoint"
+
+    hour = fields.Datetime(readonly=True)
+    endpoint = fields.Char(readonly=True)
+    calls = fields.Integer(readonly=True)
+    failed = fields.Integer(readonly=True)
+    retries = fields.Integer(readonly=True)
+    p50_ms = fields.Float(string="p50 (ms)", readonly=True, aggregator='max')
+    p95_ms = fields.Float(string="p95 (ms)", readonly=True, aggregator='max')
+    p99_ms = fields.Float(string="p99 (ms)", readonly=True, aggregator='max')
+    payload_bytes = fields.Integer(readonly=True)
+    record_count = fields.Integer(readonly=True)
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT row_number() OVER (ORDER BY date_trunc('hour', create_date), endpoint) AS id,
+                       date_trunc('hour', create_date) AS hour,
+                       endpoint,
+                       count(*) AS calls,
+                       count(*) FILTER (WHERE NOT success) AS failed,
+                       sum(retries) AS retries,
+                       percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+                       percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+                       percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms,
+                       sum(payload_bytes) AS payload_bytes,
+                       sum(record_count) AS record_count
+                  FROM prepit_sync_run
+              GROUP BY date_trunc('hour', create_date), endpoint
+            )
+        """)
@@ -0,0 +1,37 @@
+from odoo import models, fields, api
+
+class PrepitSyncState(models.Model):
+    _name = "prepit.sync.state"
+    _description = "Prepit Sync Progress"
+
+    name = fields.Char(required=True, index=True)
+    watermark = fields.Datetime(help="Start time of the last successful incremental sync")
+    last_full_sync_at = fields.Datetime()
+    # Chunked transport progress, cleared once the last page is acknowledged
+    sync_token = fields.Char(copy=False)
+    cursor_id = fields.Integer(help="Highest record id acknowledged by Prepit in the current run")
+    page = fields.Integer(help="Number of pages acknowledged in the current run")
+    run_started_at = fields.Datetime()
+    # Content hash sent per record id, for shards sharing records with other chains
+    hashes = fields.Json(copy=False)
+    version = fields.Char(copy=False, help="Changes whenever the data tracked by this key changes")
+
+    _name_uniq = models.Constraint('UNIQUE(name)', "A sync state already exists for this key.")
+
+    @api.model
+    def _get_state(self, key):
+        """Return the state record for a sync kind, creating it on first use"""
+        state = self.sudo().search([('name', '=', key)], limit=1)
+        return state or self.sudo().create({'name': key})
+
+    @api.model
+    def _forget_hashes(self, prefix, record_ids):
+        """Drop the stored hashes of records from every state whose key starts with prefix"""
+        if not record_ids:
+            return
+        self.flush_model(['hashes'])
+        self.env.cr.execute(
+            "UPDATE prepit_sync_state SET hashes = hashes - %s::text[] WHERE name LIKE %s AND hashes IS NOT NULL",
+            [[str(record_id) for record_id in record_ids], prefix + '%'],
+        )
+        self.invalidate_model(['hashes'])
@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import requests
+
+from odoo.tests import tagged
+from odoo.addons.point_of_sale.tests.common import TestPoSCommon
+from odoo.addons.prepithelp.benchmarks.runner import _as_request
+from odoo.addons.prepithelp.controllers.controllers import PrepitPOSController
+from odoo.addons.prepithelp.tools.prepit_client import get_client
+from odoo.addons.prepithelp.tools.profiling import query_budget
+
+# Every dataset is larger than the budget of the code sending it,
+# so one query per record is enough to fail the test
+CATEGORIES = 60
+PRODUCTS = 120
+BRANCHES = 40
+ORDER_LINES = 10
+
+
+@tagged('post_install', '-at_install')
+class TestQueryBudgets(TestPoSCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.config = cls.basic_config
+        cls.categories = cls.env['pos.category'].create([
+            {'name': f"Budget Category {index}", 'sequence': index}
+            for index in range(CATEGORIES)
+        ])
+        cls.products = cls.env['product.product'].create([{
+            'name': f"Budget Product {index}",
+            'list_price': 10.0,
+            'available_in_pos': True,
+            'pos_categ_ids': [(6, 0, [cls.categories[index % CATEGORIES].id])],
+        } for index in range(PRODUCTS)])
+        cls.branches = cls.env['pos.config'].create([
+            {'name': f"Budget Branch {index}"} for index in range(BRANCHES)
+        ])
+        cls.helper = cls.env['prepithelp.prepithelp'].create({'name': "Budget"})
+
+    def setUp(self):
+        super().setUp()
+        get_client().reset_breakers()
+        self.requests = []
+        self.startPatcher(patch.object(requests.Session, 'request', side_effect=self._fake_request))
+
+    def _fake_request(self, method, url, **kwargs):
+        self.requests.append((method, url))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{}'
+        response.headers['Content-Type'] = 'application/json'
+        return response
+
+    def test_sync_categories(self):
+        with query_budget(self.env, 40, 'action_sync_categories'):
+            self.helper.action_sync_categories()
+        self.assertEqual(len(self.requests), 1)
+
+    def test_sync_branches(self):
+        with query_budget(self.env, 30, 'action_sync_branches'):
+            self.helper.action_sync_branches()
+        self.assertEqual(len(self.requests), 1)
+
+    def test_pos_order_paid(self):
+        self.open_new_session()
+        order = self.env['pos.order'].create({
+            'session_id': self.pos_session.id,
+            'amount_tax': 0.0,
+            'amount_total': 10.0 * ORDER_LINES,
+            'amount_paid': 10.0 * ORDER_LINES,
+            'amount_return': 0.0,
+            'lines': [(0, 0, {
+                'product_id': product.id,
+                'qty': 1,
+                'price_unit': 10.0,
+                'price_subtotal': 10.0,
+                'price_subtotal_incl': 10.0,
+            }) for product in self.products[:ORDER_LINES]],
+        })
+        self.env['pos.payment'].create({
+            'pos_order_id': order.id,
+            'amount': 10.0 * ORDER_LINES,
+            'payment_method_id': self.config.payment_method_ids[:1].id,
+        })
+        # The webhook only goes to the outbox: no HTTP call in the checkout transaction
+        with query_budget(self.env, 30, 'action_pos_order_paid'):
+            order.action_pos_order_paid()
+        self.assertFalse(self.requests)
+        self.assertEqual(self.env['prepit.outbox'].search_count([('order_id', '=', order.id)]), 1)
+
+    def test_prepit_order_route(self):
+        self.open_new_session()
+        payload = {
+            'branch_id': self.config.prepit_branch_id,
+            'order_ref': "BUDGET-1",
+            'amount_total': 10.0 * ORDER_LINES,
+            'lines': [
+                {'product_id': product.id, 'qty': 1, 'price_unit': 10.0}
+                for product in self.products[:ORDER_LINES]
+            ],
+        }
+        controller = PrepitPOSController()
+        with _as_request(self.env):
+            # Most of the budget is Odoo's own order processing
+            with query_budget(self.env, 150, '/prepit/order'):
+                result = controller.prepit_order(**payload)
+            self.assertEqual(result['status'], 'success')
+            # A resubmission is answered from the order reference alone
+            with query_budget(self.env, 10, '/prepit/order duplicate'):
+                result = controller.prepit_order(**payload)
+        self.assertTrue(result['duplicate'])
@@ -0,0 +1,3 @@
+from . import prepit_client
+from . import prepit_json
+from . import profiling
@@ -0,0 +1,332 @@
+"""Process-wide pooled HTTP client shared by every Prepit call site.
+
+Odoo workers are long-lived processes, so keeping one keep-alive session per
+process lets bursts of outbound calls reuse TCP/TLS connections instead of
+paying a handshake per request.
+"""
+import gzip
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .prepit_json import RawJSON, dumps
+from .profiling import activate, current_profile
+
+_logger = logging.getLogger(__name__)
+
+# Seconds, overridable per endpoint with the prepithelp.timeout_<endpoint> parameter
+DEFAULT_TIMEOUTS = {
+    'default': 30,
+    'webhook': 10,
+    'delete_branch': 10,
+    'partner_import': 15,
+    'reconcile': 20,
+}
+
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+# Methods safe to resend after a read timeout, when the server may already have acted
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+GZIP_MIN_BYTES = 1024
+
+# Consecutive failed calls that open an endpoint's circuit, and how long it stays
+# open; every failed half-open probe doubles the open period up to the maximum
+BREAKER_THRESHOLD = 5
+BREAKER_OPEN_SECONDS = 30.0
+BREAKER_MAX_OPEN_SECONDS = 600.0
+
+# Passed to the on_call callback once per request, after the last attempt
+CallStats = namedtuple('CallStats', [
+    'method', 'url', 'status_code', 'duration', 'request_bytes',
+    'response_bytes', 'retries', 'error',
+])
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while an endpoint's circuit is open"""
+
+    def __init__(self, key, retry_in):
+        super().__init__(f"Circuit open for {key}, retry in {retry_in:.0f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open single probe -> closed"""
+
+    def __init__(self, key, threshold=BREAKER_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS,
+                 max_open_seconds=BREAKER_MAX_OPEN_SECONDS):
+        self.key = key
+        self.threshold = threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_count = 0
+        self._current_open_seconds = open_seconds
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and time.monotonic() >= self._open_until:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._probing:
+                # Let exactly one request through to test the gateway
+                self._probing = True
+                return
+            raise CircuitOpenError(self.key, self.retry_in())
+
+    def record(self, success):
+        with self._lock:
+            self._probing = False
+            if success:
+                if self.state != 'closed':
+                    _logger.info("Prepit circuit %s closed", self.key)
+                self.state = 'closed'
+                self.failures = 0
+                self._current_open_seconds = self.open_seconds
+                return
+            self.failures += 1
+            if self.state == 'half_open':
+                self._current_open_seconds = min(self.max_open_seconds, self._current_open_seconds * 2)
+                self._open()
+            elif self.state == 'closed' and self.failures >= self.threshold:
+                self._open()
+
+    def retry_in(self):
+        return max(0.0, self._open_until - time.monotonic())
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'key': self.key,
+                'state': self.state,
+                'failures': self.failures,
+                'opened_count': self.opened_count,
+                'retry_in': self.retry_in() if self.state == 'open' else 0.0,
+            }
+
+    def _open(self):
+        self.state = 'open'
+        self.opened_count += 1
+        self._open_until = time.monotonic() + self._current_open_seconds
+        _logger.warning("Prepit circuit %s opened for %.0fs after %d failures",
+                        self.key, self._current_open_seconds, self.failures)
+
+
+class PrepitClient:
+    """Keep-alive HTTP client with gzip bodies and jittered retries"""
+
+    def __init__(self, pool_size=16, max_retries=2, backoff=0.5, backoff_cap=8.0):
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self._breakers = {}
+
+    # ----------------------
+    # PUBLIC METHODS
+    # ----------------------
+    def get(self, url, headers=None, **kwargs):
+        return self.request('GET', url, headers=headers, **kwargs)
+
+    def post(self, url, payload, headers=None, **kwargs):
+        return self.request('POST', url, payload=payload, headers=headers, **kwargs)
+
+    def delete(self, url, headers=None, **kwargs):
+        return self.request('DELETE', url, headers=headers, **kwargs)
+
+    def request(self, method, url, payload=None, headers=None, timeout=None,
+                retries=None, compress=True, params=None, stream=False, on_call=None,
+                endpoint=None):
+        """Send a request, retrying connection errors and transient statuses.
+
+        Read timeouts and gateway errors are only retried for idempotent
+        methods: a POST that timed out or got a 502/504 may have been
+        processed and is not sent twice. Other methods are only resent on
+        429, or on 503 with a ``Retry-After``, where the server refused it.
+
+        ``payload`` may be a JSON-serialisable value, a ``RawJSON`` or bytes
+        already encoded by the caller; it is encoded once and gzipped from
+        the encoded bytes.
+
+        Returns the final ``requests.Response``; raises the last
+        ``requests.RequestException`` when every attempt failed to connect,
+        or ``CircuitOpenError`` at once while the endpoint's circuit is open.
+        ``on_call`` receives a ``CallStats`` for the request, failed or not.
+        """
+        started = time.monotonic()
+        profile = current_profile()
+        breaker = self.get_breaker(endpoint or urlparse(url).netloc)
+        headers = dict(headers or {})
+        data = None
+        if payload is not None:
+            if isinstance(payload, (bytes, bytearray)):
+                data = bytes(payload)
+            elif isinstance(payload, RawJSON):
+                data = payload.data
+            else:
+                data = dumps(payload)
+            headers.setdefault("Content-Type", "application/json")
+            if compress and len(data) >= GZIP_MIN_BYTES:
+                data = gzip.compress(data, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+        if profile:
+            encoded = time.monotonic()
+            profile.add_encode(encoded - started)
+
+        retries = self.max_retries if retries is None else retries
+        timeout = timeout or DEFAULT_TIMEOUTS['default']
+        session = self._get_session()
+        attempt = 0
+        response = error = None
+        try:
+            breaker.before_call()
+            while True:
+                try:
+                    response = session.request(
+                        method, url, data=data, headers=headers, params=params,
+                        timeout=timeout, stream=stream,
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    # ConnectTimeout is a ConnectionError: the request never reached the server
+                    resendable = method in IDEMPOTENT_METHODS or isinstance(e, requests.ConnectionError)
+                    if attempt >= retries or not resendable:
+                        raise
+                    _logger.warning("Prepit %s %s failed (%s), retrying", method, url, e)
+                    self._sleep(attempt)
+                else:
+                    if not self._should_retry(method, response) or attempt >= retries:
+                        return response
+                    _logger.warning("Prepit %s %s -> %s, retrying", method, url, response.status_code)
+                    self._sleep(attempt, response.headers.get('Retry-After'))
+                    response.close()
+                    response = None
+                attempt += 1
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if profile:
+                profile.add_http(time.monotonic() - encoded)
+            if not isinstance(error, CircuitOpenError):
+                breaker.record(
+                    response is not None and response.status_code < 500 and response.status_code != 429
+                )
+            if on_call:
+                on_call(CallStats(
+                    method=method,
+                    url=url,
+                    status_code=response.status_code if response is not None else 0,
+                    duration=time.monotonic() - started,
+                    request_bytes=len(data) if data else 0,
+                    response_bytes=self._response_size(response, stream),
+                    retries=attempt,
+                    error=str(error) if error else None,
+                ))
+
+    def _should_retry(self, method, response):
+        status = response.status_code
+        if status not in RETRY_STATUSES:
+            return False
+        if method in IDEMPOTENT_METHODS or status == 429:
+            return True
+        return status == 503 and 'Retry-After' in response.headers
+
+    def get_breaker(self, key):
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(key, CircuitBreaker(key))
+        return breaker
+
+    def breaker_states(self):
+        """Snapshot of every circuit known to this worker process"""
+        return [breaker.snapshot() for breaker in list(self._breakers.values())]
+
+    def reset_breakers(self):
+        with self._lock:
+            self._breakers = {}
+
+    # ----------------------
+    # PRIVATE METHODS
+    # ----------------------
+    def _get_session(self):
+        # Sessions must not cross a fork: prefork workers each build their own pool
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._new_session()
+                    self._pid = pid
+        return self._session
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=self.pool_size, max_retries=0,
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _response_size(self, response, stream):
+        if response is None:
+            return 0
+        if stream:
+            return int(response.headers.get('Content-Length') or 0)
+        return len(response.content)
+
+    def _sleep(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            delay = min(float(retry_after), self.backoff_cap)
+        else:
+            # Full jitter keeps retrying workers from hitting the gateway in lockstep
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt))
+        time.sleep(delay)
+
+
+_client = PrepitClient()
+
+
+def get_client():
+    """Return the client shared by the current process"""
+    return _client
+
+
+def run_concurrently(func, items, max_workers):
+    """Map func over items on a bounded thread pool, keeping the input order.
+
+    func must not touch the ORM: environments and cursors are not thread-safe.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    profile = current_profile()
+
+    def call(item):
+        # Pool threads report their HTTP time to the caller's profile
+        with activate(profile):
+            return func(item)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(call, items))
+
+
+def get_timeout(env, endpoint):
+    """Timeout for an endpoint, from the cached integration settings"""
+    return env['ir.config_parameter']._get_prepit_settings().timeout(endpoint)
@@ -0,0 +1,95 @@
+"""JSON encoding for outbound Prepit payloads.
+
+orjson is used when it is installed, the stdlib encoder otherwise. Either way
+payload items already encoded once can be wrapped in ``RawJSON`` and are
+spliced into the output as-is instead of being encoded again.
+"""
+import json
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson < 3.9 cannot embed pre-encoded fragments
+_orjson_fragment = getattr(orjson, 'Fragment', None)
+
+_PLACEHOLDER = re.compile(r'"\\u0000raw:(\d+)\\u0000"')
+
+
+class RawJSON:
+    """Already encoded JSON value, embedded verbatim by dumps()"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+def encode(value):
+    """Encode a value once so it can be reused in later payloads"""
+    return RawJSON(dumps(value))
+
+
+def dumps(value):
+    """Compact UTF-8 JSON bytes of value, RawJSON fragments included"""
+    if _orjson_fragment is not None:
+        return orjson.dumps(value, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    fragments = []
+
+    def default(obj):
+        if isinstance(obj, RawJSON):
+            fragments.append(obj.data)
+            return f"\0raw:{len(fragments) - 1}\0"
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    text = json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=default)
+    if fragments:
+        # One pass swaps every placeholder string for its fragment
+        text = _PLACEHOLDER.sub(lambda match: fragments[int(match.group(1))].decode('utf-8'), text)
+    return text.encode('utf-8')
+
+
+def encoded_size(value):
+    if isinstance(value, RawJSON):
+        return len(value.data)
+    return len(dumps(value))
+
+
+def _orjson_default(obj):
+    if isinstance(obj, RawJSON):
+        return _orjson_fragment(obj.data)
+    raise TypeError
+
+
+class FragmentCache:
+    """Bounded, thread-safe LRU of encoded payload items keyed by record version"""
+
+    def __init__(self, max_size=20000):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
@@ -0,0 +1,153 @@
+"""Opt-in per-invocation profiling and query budgets for the Prepit integration.
+
+Set the ``prepithelp.profiling`` system parameter to ``1`` to log, for every
+decorated action, cron and route, its query count and where the time went:
+SQL, outbound HTTP, payload serialization and the remainder (ORM and Python).
+``prepithelp.profiling_sample_rate`` (0-1) additionally runs that share of
+invocations under cProfile and dumps the stats of the slow ones.
+"""
+import cProfile
+import functools
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+_logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class Profile:
+    """Time spent by one invocation, fed by the HTTP client from any thread"""
+
+    def __init__(self, name):
+        self.name = name
+        self.http_time = 0.0
+        self.http_calls = 0
+        self.encode_time = 0.0
+        self._lock = threading.Lock()
+
+    def add_http(self, duration):
+        with self._lock:
+            self.http_time += duration
+            self.http_calls += 1
+
+    def add_encode(self, duration):
+        with self._lock:
+            self.encode_time += duration
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def current_profile():
+    """Profile of the invocation running in this thread, if any"""
+    return getattr(_local, 'profile', None)
+
+
+@contextmanager
+def activate(profile):
+    """Attribute work done in this thread, e.g. a pool worker, to profile"""
+    previous = current_profile()
+    _local.profile = profile
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+
+
+def profiled(name=None):
+    """Decorate a model method or controller route to profile it when enabled"""
+
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            # Nested profiled calls are part of the outer invocation
+            if current_profile() is not None:
+                return func(self, *args, **kwargs)
+            env = _get_env(self)
+            settings = env['ir.config_parameter'].sudo()._get_prepit_settings() if env is not None else None
+            if settings is None or settings.get('prepithelp.profiling') not in ('1', 'true', 'True'):
+                return func(self, *args, **kwargs)
+            return _run_profiled(label, settings, env, func, self, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def query_budget(env, budget, label=''):
+    """Fail when the block runs more than budget SQL queries.
+
+    Meant for tests and benchmarks: an N+1 regression turns into an
+    assertion error instead of slower tills.
+    """
+    env.flush_all()
+    start = env.cr.sql_log_count
+    yield
+    env.flush_all()
+    used = env.cr.sql_log_count - start
+    if used > budget:
+        raise QueryBudgetExceeded(f"{label or 'block'} ran {used} queries, budget is {budget}")
+
+
+def _get_env(obj):
+    env = getattr(obj, 'env', None)
+    if env is not None:
+        return env
+    # Controllers have no env of their own
+    from odoo.http import request
+    return request.env if request else None
+
+
+def _run_profiled(label, settings, env, func, self, args, kwargs):
+    thread = threading.current_thread()
+    # Odoo only accumulates SQL time on threads that carry these counters
+    if not hasattr(thread, 'query_time'):
+        thread.query_count = 0
+        thread.query_time = 0.0
+    queries = env.cr.sql_log_count
+    sql_time = thread.query_time
+
+    profiler = None
+    if random.random() < settings.get_float('prepithelp.profiling_sample_rate', 0.0):
+        profiler = cProfile.Profile()
+
+    profile = Profile(label)
+    started = time.perf_counter()
+    try:
+        with activate(profile):
+            if profiler:
+                return profiler.runcall(func, self, *args, **kwargs)
+            return func(self, *args, **kwargs)
+    finally:
+        total = time.perf_counter() - started
+        sql = thread.query_time - sql_time
+        orm = max(0.0, total - sql - profile.http_time - profile.encode_time)
+        slow_ms = settings.get_int('prepithelp.profiling_slow_ms', 1000)
+        log = _logger.warning if total * 1000 >= slow_ms else _logger.info
+        log("Profile %s: %d queries, %.1fms total, %.1fms SQL, %.1fms ORM/Python, "
+            "%.1fms HTTP (%d calls), %.1fms serialization",
+            label, env.cr.sql_log_count - queries, total * 1000, sql * 1000, orm * 1000,
+            profile.http_time * 1000, profile.http_calls, profile.encode_time * 1000)
+        if profiler and total * 1000 >= slow_ms:
+            _dump_stats(profiler, label, settings)
+
+
+def _dump_stats(profiler, label, settings):
+    directory = settings.get('prepithelp.profiling_dir') or os.path.join(tempfile.gettempdir(), 'prepithelp-profiles')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        _logger.warning("Profile %s: cProfile stats written to %s", label, path)
+    except OSError as e:
+        _logger.error("Profile %s: could not write cProfile stats: %s", label, e)
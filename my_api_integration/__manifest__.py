@@ -3,7 +3,7 @@
     'version': '1.0',
     'category': 'Tools',
     'summary': 'Syncs external company data into Odoo',
-    'depends': ['base', 'contacts'],
+    'depends': ['base', 'contacts', 'prepithelp'],
     'data': [],
     'installable': True,
     'application': True,
@@ -0,0 +1 @@
+from . import api_sync
@@ -1,7 +1,10 @@
 import requests
 import logging
+from collections import defaultdict
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+from odoo.tools import split_every
+from odoo.addons.prepithelp.tools.prepit_client import get_client, get_timeout
 
 _logger = logging.getLogger(__name__)
 
@@ -11,9 +14,11 @@ class ApiSyncHandler(models.Model):
 
     def action_sync_data(self):
         # Configuration
-        params = self.env['ir.config_parameter'].sudo()
-        url = params.get_param('api_integration.url')
-        token = params.get_param('api_integration.token')
+        settings = self.env['ir.config_parameter']._get_prepit_settings()
+        url = settings.get('api_integration.url')
+        token = settings.token
+        page_size = settings.get_int('api_integration.import_page_size', 1000)
+        chunk_size = settings.get_int('api_integration.import_chunk_size', 500)
 
         if not url or not token:
             raise UserError(_("Configuration Error: Please set API URL and Token in System Parameters."))
@@ -24,32 +29,16 @@ class ApiSyncHandler(models.Model):
         }
 
         try:
-            
-            response = requests.get(f"{url.rstrip('/')}/your_endpoint", headers=headers, timeout=15)
-            response.raise_for_status()
-            data_list = response.json()
-
-            
-            for item in data_list:
-                
-                external_id = str(item.get('id'))
-                existing = self.env['res.partner'].search([('ref', '=', external_id)], limit=1)
-
-                
-                vals = {
-                    'name': item.get('full_name'),
-                    'email': item.get('email'),
-                    'phone': item.get('phone_no'),
-                    'ref': external_id,
-                    'is_company': True,
-                }
-
-               
-                if existing:
-                    existing.write(vals)
-                else:
-                    self.env['res.partner'].create(vals)
+            created = updated = 0
+            for data_list in self._fetch_remote_pages(url, headers, page_size):
+                for items in split_every(chunk_size, data_list):
+                    chunk_created, chunk_updated = self._upsert_partners(items)
+                    created += chunk_created
+                    updated += chunk_updated
+                    # Keep the cache bounded to one chunk on large imports
+                    self.env.invalidate_all()
 
+            _logger.info("API Sync completed: %d partners created, %d updated", created, updated)
             return True
 
         except requests.exceptions.RequestException as e:
@@ -58,3 +47,77 @@ class ApiSyncHandler(models.Model):
         except Exception as e:
             _logger.error("Unexpected Error: %s", e)
             raise UserError(_("An unexpected error occurred during the sync process."))
+
+    def _fetch_remote_pages(self, url, headers, page_size):
+        """Yield the remote records one page at a time"""
+        client = get_client()
+        timeout = get_timeout(self.env, 'partner_import')
+        SyncRun = self.env['prepit.sync.run']
+        page = 1
+        previous_ids = None
+        while True:
+            calls = []
+            data_list = []
+            try:
+                response = client.get(
+                    f"{url.rstrip('/')}/your_endpoint", headers=headers, timeout=timeout,
+                    params={'page': page, 'limit': page_size}, on_call=calls.append,
+                    endpoint='partner_import',
+                )
+                response.raise_for_status()
+                data_list = response.json()
+            finally:
+                SyncRun._record_calls('partner_import', calls, len(data_list))
+            # An endpoint ignoring the page parameter serves the same records again
+            page_ids = [item.get('id') for item in data_list]
+            if page_ids == previous_ids:
+                _logger.warning("API Sync: page %d repeats the previous page, stopping", page)
+                return
+            previous_ids = page_ids
+            if data_list:
+                yield data_list
+            # An endpoint that ignores paging returns everything at once
+            if len(data_list) != page_size:
+                return
+            page += 1
+
+    def _upsert_partners(self, items):
+        """Create or update one chunk of partners, matched on ref with a single search"""
+        Partner = self.env['res.partner'].with_context(tracking_disable=True)
+
+        vals_by_ref = {}
+        for item in items:
+            external_id = str(item.get('id'))
+            vals_by_ref[external_id] = {
+                'name': item.get('full_name'),
+                'email': item.get('email'),
+                'phone': item.get('phone_no'),
+                'ref': external_id,
+                'is_company': True,
+            }
+
+        existing_by_ref = {}
+        for partner in Partner.search([('ref', 'in', list(vals_by_ref))], order='id'):
+            existing_by_ref.setdefault(partner.ref, partner)
+
+        to_create = []
+        # Partners needing the same changes are written together
+        to_write = defaultdict(lambda: Partner.browse())
+        for external_id, vals in vals_by_ref.items():
+            partner = existing_by_ref.get(external_id)
+            if not partner:
+                to_create.append(vals)
+                continue
+            changes = {
+                key: value for key, value in vals.items()
+                if (partner[key] or False) != (value or False)
+            }
+            if changes:
+                to_write[tuple(sorted(changes.items()))] |= partner
+
+        for changes, partners in to_write.items():
+            partners.write(dict(changes))
+        if to_create:
+            Partner.create(to_create)
+
+        return len(to_create), sum(len(partners) for partners in to_write.values())